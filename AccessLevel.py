@@ -4,8 +4,15 @@
 # @details This file contains functions for access level management.
 
 import yaml
+import os
 from os.path import exists
 import logging
+import threading
+import tempfile
+try:
+    from yaml import CSafeLoader as Loader, CSafeDumper as Dumper
+except ImportError:
+    from yaml import SafeLoader as Loader, SafeDumper as Dumper
 
 __save_vars=["log", "__accessLevels"]
 
@@ -14,6 +21,64 @@ __save_vars=["log", "__accessLevels"]
 #          the command is the key.
 #  @private
 __accessLevels=dict()
+
+## @brief Changes of the access levels
+# @details Incremented every time an access level changes, so others can invalidate
+#          what they computed from the access levels.
+generation=0
+
+## @brief The file to which the access levels are saved.
+# @details Set by load(). Changes are appended to this file with the ending .journal.
+# @private
+__file=None
+
+## @brief The journal file
+# @details Every change of an access level is appended to it when it happens.
+# @private
+__journal=None
+
+## @brief Number of changes in the journal
+# @private
+__journalEntries=0
+
+## @brief Compact the journal after this many changes.
+# @details The access levels are written to the file in the background and the journal is emptied.
+compact_after=100
+
+## @brief Protects the journal
+# @private
+__lock=threading.RLock()
+
+## @brief Is a compaction running?
+# @private
+__compacting=False
+
+## @brief Serializes writing the snapshot
+# @private
+__snapshotLock=threading.Lock()
+
+## @brief generations of the access levels in the last written snapshots
+# @details Dictionary where the file is the key. Older snapshots aren't written anymore,
+#          so a slow compaction can't replace the file written by a later save().
+# @private
+__snapshotGenerations=dict()
+
+## @brief Access levels of the parameters
+# @details Dictionary of dictionaries of the access levels of the parameters of a command,
+#          where the lowercase command is the key. The inner dictionaries have the lowercase
+#          parameter name as key. Built from the "<command>_param_<name>" entries by
+#          __compile() every time the access levels changed.
+# @private
+__paramAccessLevels=dict()
+
+## @brief generation for which __paramAccessLevels was built.
+# @private
+__compiledGeneration=None
+
+## @brief Commands for which a missing access level was already logged.
+# @private
+__warned=set()
+
 ## @cond
 log=logging.getLogger("AccessLevel")
 log.addHandler(logging.NullHandler() )
@@ -24,18 +89,79 @@ log.addHandler(logging.NullHandler() )
 #  @param command The name of the command for which to check the access level
 #  @param access The given access level.
 def isAllowed(command, access):
-    access=int(access)
-    if command not in __accessLevels:
-        log.warning("No access level for command "+command+" registered. Using 0 as access level.")
+    if type(access)!=int:
+        access=int(access)
+    try:
+        return __accessLevels[command]>=access
+    except KeyError:
+        if command not in __warned:
+            __warned.add(command)
+            log.warning("No access level for command "+command+" registered. Using 0 as access level.")
         return (access<=0)
-    return __accessLevels[command]>=access
+
+## @brief Builds __paramAccessLevels.
+# @private
+def __compile():
+    global __paramAccessLevels
+    global __compiledGeneration
+    current=generation
+    paramAccessLevels=dict()
+    for key, access in list(__accessLevels.items()):
+        command, sep, param=key.partition("_param_")
+        if not sep:
+            continue
+        command=command.lower()
+        if command not in paramAccessLevels:
+            paramAccessLevels[command]=dict()
+        paramAccessLevels[command][param.lower()]=access
+    __paramAccessLevels=paramAccessLevels
+    __compiledGeneration=current
+
+## @brief Gets the access levels of the parameters of a command.
+#  @param command The name of the command.
+#  @return Dictionary of the access levels, where the lowercase parameter name is the key.
+#          Parameters without an access level aren't included.
+def getParamAccessLevels(command):
+    if __compiledGeneration!=generation:
+        __compile()
+    return __paramAccessLevels.get(command.lower(), {})
+
+## @brief Checks the access level for a parameter
+#  @details Checks if the given access level is high enough to use a parameter of a command.
+#  @param command The name of the command.
+#  @param param The name of the parameter.
+#  @param access The given access level.
+#  @return True if the parameter can be used or has no access level, False otherwise.
+def isParamAllowed(command, param, access):
+    access_needed=getParamAccessLevels(command).get(param.lower())
+    return access_needed==None or access_needed>=int(access)
 
 ## @brief Registers or changes an access level
-#  @details Sets the minimum required access level for the given command
+#  @details Sets the minimum required access level for the given command. The change is
+#           written to the journal immediately, so it isn't lost if the script crashes.
 #  @param command The command for which to change the access level 
 #  @param access The access level
 def setAccessLevel(command,access):
-    __accessLevels[command]=access
+    global generation
+    global __journalEntries
+    with __lock:
+        __accessLevels[command]=access
+        generation+=1
+        if __journal==None:
+            return
+        try:
+            __journal.write(yaml.dump({command: access}, Dumper=Dumper, default_flow_style=True, width=1<<30))
+            __journal.flush()
+            os.fsync(__journal.fileno())
+        except OSError as e:
+            log.error("Could not write access level change to the journal: "+str(e))
+            return
+        __journalEntries+=1
+        if __journalEntries>=compact_after:
+            t=threading.Thread(target=compact, name="AccessLevelCompact")
+            t.daemon=True
+            t.start()
+            __journalEntries=0
 
 ## @brief Get the access level needed.
 def getAccessLevel(command):
@@ -44,23 +170,156 @@ def getAccessLevel(command):
     else:
         return __accessLevels[command]
     
+## @brief Writes the access levels to a file.
+# @details The file is replaced atomically, so it's never left half written. Every writer
+#          uses its own temporary file.
+# @private
+# @param current The generation of accessLevels. Nothing is written if a snapshot of a
+#                later generation was written already.
+def __writeSnapshot(accessLevels, file, current):
+    with __snapshotLock:
+        if current<__snapshotGenerations.get(file, -1):
+            return
+        fd, tmp=tempfile.mkstemp(prefix=os.path.basename(file)+".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(file)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                yaml.dump(accessLevels, f, Dumper=Dumper, default_flow_style=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, file)
+        except OSError:
+            if exists(tmp):
+                os.remove(tmp)
+            raise
+        __snapshotGenerations[file]=current
+
+## @brief Applies the changes in a journal.
+# @private
+def __replayJournal(file):
+    if not exists(file):
+        return 0
+    count=0
+    with open(file) as f:
+        for line in f:
+            try:
+                change=yaml.load(line, Loader=Loader)
+            except yaml.YAMLError:
+                log.warning("Ignoring broken line in "+file+": "+line.strip())
+                continue # Last line of a crashed script
+            if type(change)==dict:
+                __accessLevels.update(change)
+                count+=1
+    return count
+
+## @brief Opens a new, empty journal.
+# @private
+# @note Must be called with __lock held.
+def __openJournal():
+    global __journal
+    global __journalEntries
+    if __journal!=None:
+        __journal.close()
+    __journal=open(__file+".journal", "w")
+    __journalEntries=0
+
+## @brief Puts the changes of .journal.old back into the journal.
+# @details Used if writing the snapshot failed, so the next compaction can try again.
+# @private
+# @note Must be called with __lock held.
+def __mergeOldJournal():
+    global __journal
+    global __journalEntries
+    old=__file+".journal.old"
+    if not exists(old):
+        return
+    __journal.close()
+    with open(old) as f:
+        data=f.read()
+    with open(__file+".journal") as f:
+        current=f.read()
+    if data and not data.endswith("\n"):
+        data+="\n" # Last line of a crashed script
+    with open(__file+".journal.tmp", "w") as f:
+        f.write(data+current)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(__file+".journal.tmp", __file+".journal")
+    os.remove(old)
+    __journal=open(__file+".journal", "a")
+    __journalEntries=len((data+current).splitlines())
+
+## @brief Compacts the journal
+# @details Writes all access levels to the file and deletes the changes in the journal.
+#          Changes made meanwhile go to a new journal. If writing fails, the changes stay
+#          in the journal.
+def compact():
+    global __compacting
+    if __file==None:
+        return
+    with __lock:
+        if __compacting:
+            return
+        __compacting=True
+        try:
+            __mergeOldJournal() # Left by a failed compaction
+            __journal.flush()
+            os.replace(__file+".journal", __file+".journal.old")
+            __openJournal()
+        except OSError as e:
+            __compacting=False
+            log.error("Could not compact access levels: "+str(e))
+            return
+        accessLevels=dict(__accessLevels)
+        current=generation
+    try:
+        __writeSnapshot(accessLevels, __file, current)
+        with __lock:
+            if exists(__file+".journal.old"): # save() might have removed it
+                os.remove(__file+".journal.old")
+    except OSError as e:
+        log.error("Could not compact access levels: "+str(e))
+        with __lock:
+            try:
+                __mergeOldJournal()
+            except OSError as e:
+                log.error("Could not restore the journal: "+str(e))
+    finally:
+        with __lock:
+            __compacting=False
+
 ## @brief Save access levels to a file
-# @details Saves access levels to a file by using yaml. 
+# @details Saves access levels to a file by using yaml and empties the journal. 
 # @param file: The name of the file to which to save access levels. Default is access.yaml
 def save(file="access.yaml"):
-    with open(file, "w") as f:
-        yaml.dump(__accessLevels, f, default_flow_style=False)
+    with __lock:
+        __writeSnapshot(dict(__accessLevels), file, generation)
+        if file==__file:
+            __openJournal()
+            if exists(file+".journal.old"):
+                os.remove(file+".journal.old")
 
 ## @brief Read access levels from a file.
-#  @details Uses yaml to read the access levels from a file into the memory.
+#  @details Uses yaml to read the access levels from a file into the memory and applies
+#           the changes from the journal. Later changes are written to the journal.
 #  @param file The name of the file to read from.
 #  e@info If the file doesn't exists, it's ignored.
 def load(file="access.yaml"):
     global __accessLevels
-    if not exists("access.yaml"):
-        return
-    with open(file) as f:
-        __accessLevels=yaml.load(f)
+    global generation
+    global __file
+    with __lock:
+        if exists(file):
+            with open(file) as f:
+                __accessLevels=yaml.load(f, Loader=Loader) or dict()
+        changes=__replayJournal(file+".journal.old")
+        changes+=__replayJournal(file+".journal")
+        generation+=1
+        __file=file
+        if changes:
+            # Save the replayed changes, so the journal can start empty.
+            save(file)
+        else:
+            __openJournal()
         
 def accessLevelSet(command):
     return command in __accessLevels
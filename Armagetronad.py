@@ -5,30 +5,46 @@
 
 import Messages
 import sys
-import threading
-import re
 import LadderLogHandlers
 import Global
 import time
+import Scheduler
+import Settings
+import GridPos
 
 
 
 ## @brief Executes a command
 # @details Send a command to the server. You only have to replace this function if you
 #          don't want to print commands to stdout.
+# @note Commands are buffered. They are sent after the current ladderlog event was
+#       handled or by sys.stdout.flush().
 # @param command The command to send
 # @param delay Seconds to wait before executing the command.
-def SendCommand(command, delay=0, forked=False):
-    if delay and not forked:
-        t=threading.Thread(target=SendCommand, args=(command, delay, True) )
-        t.daemon=True
-        t.start()
-        return
-    if forked:
-        time.sleep(delay)
+# @param group Optional Group of the delayed command, see Scheduler.CancelGroup. LadderLogHandlers
+#              cancels the groups "round" and "match" when a new round or match starts.
+# @return A Scheduler.Job if the command was delayed, None otherwise.
+def SendCommand(command, delay=0, group=None):
+    if delay:
+        return Scheduler.Add(delay, SendCommand, command, group=group)
     command=command.replace("\n","\\n") # Never allow to execute more than one command.
+    setting, sep, value=command.partition(" ")
+    if sep and IsSetting(setting):
+        Settings.Record(setting.upper(), value)
     print(command)
-    sys.stdout.flush()
+
+## @brief Executes several commands
+# @details Sends the commands to the server with one write.
+# @param commands Iterable of the commands to send.
+def SendCommands(commands):
+    commands=[command.replace("\n","\\n") for command in commands]
+    if not commands:
+        return
+    for command in commands:
+        setting, sep, value=command.partition(" ")
+        if sep and IsSetting(setting):
+            Settings.Record(setting.upper(), value)
+    print("\n".join(commands))
 
 ## @brief Prints a message
 # @details Writes a message to the game
@@ -54,69 +70,41 @@ def PrintPlayerMessage(player,msg, color=None):
 
 ## @brief Gets the position and direction of a player's cycle
 # @details Returns the x,y coordinates and xdir and ydir of a specific player's cycle.
+#          Waits for the next position update if the known position is older than max_age.
 # @param player The player for which to get the position.
+# @param max_age Maximal age of the position in seconds.
+# @param timeout Seconds to wait for a position update.
 # @return A tuple x,y, xdir, ydir.
-def GetPlayerPosition(player):
-    gotpos=threading.Condition()
-    def getPos(playername, x, y, xdir, ydir, *args):
-        if playername!=player:
-            return
-        global cur_pos
-        cur_pos=tuple([round(float(i),2) for i in (x,y,xdir, ydir)] )
-        gotpos.acquire()
-        gotpos.notify_all()
-        gotpos.release()
-    if "PLAYER_GRIDPOS" not in LadderLogHandlers.extraHandlers:
-        LadderLogHandlers.extraHandlers["PLAYER_GRIDPOS"]=[]    
-    gotpos.acquire()
-    LadderLogHandlers.extraHandlers["PLAYER_GRIDPOS"].append(getPos)
-    SendCommand("GRID_POSITION_INTERVAL 0")
-    SendCommand("LADDERLOG_WRITE_PLAYER_GRIDPOS 1")
-    gotpos.wait()
-    SendCommand("LADDERLOG_WRITE_PLAYER_GRIDPOS 0")
-    LadderLogHandlers.extraHandlers["PLAYER_GRIDPOS"].remove(getPos)
-    global cur_pos
-    pos=cur_pos
-    del cur_pos
+# @exception RuntimeError Raised if the position isn't known after timeout seconds.
+# @see GridPos.Get
+def GetPlayerPosition(player, max_age=0.5, timeout=5):
+    pos=GridPos.Get(player, max_age=max_age, timeout=timeout)
+    if pos==None:
+        raise RuntimeError("No position of player "+player+" available.")
     return pos
 
 ## @brief Check if the given command is a setting.
 # @return True if yes, False if no.
 def IsSetting(command):
-    if command in Global.not_a_setting or len([i for i in Global.not_a_setting_prefixes if command.startswith(i)])>0:
-        return False
-    else:
-        return True
+    return not (command in Global.not_a_setting or command.startswith(Global.not_a_setting_prefixes))
 
 ## @brief Get the value of a game setting.
-# @details Reads the serverlog and looks for a line "SETTING is currently set to X"
+# @details Returns the value from Settings if it's known. Otherwise the server is asked for the
+#          value and this function waits until the answer is written to the server log.
 # @param setting The name of the setting.
-# @return The value to which the setting is currently set.
+# @param timeout Seconds to wait for the server's answer.
+# @return The value to which the setting is currently set. An empty string if the server
+#         didn't answer within timeout.
 # @note This requires that the script was started with run.py. Otherwise RuntimeError is raised.
+# @see Settings.Get for a non-blocking version.
 def GetSetting(setting, timeout=5):
     if not IsSetting(setting):    
         raise ValueError("Not a setting.")
+    setting=setting.upper()
+    if Settings.Known(setting):
+        return Settings.Get(setting)
     if not Global.serverlog:
         raise RuntimeError("Script wasn't started with run.py or Global.serverlog wasn't set.")
-    startpattern=r"\[0[^\]]*\] "
-    pattern1=re.compile(startpattern+setting.upper()+r" is currently set to (?P<value>[^.]*)\.")
-    pattern2=re.compile(startpattern+setting.upper()+r" changed from (?P<value>((([^t]|t+[^o])*)(to)*)*)to \.")
-    serverlog=open(Global.serverlog, encoding="latin-1")
-    serverlog.seek(0,2)
-    SendCommand(setting.upper())
-    match=None
-    for i in range(timeout*2): #@UnusedVariable
-        for line in serverlog.readlines():
-            match=pattern1.search(line)
-            if match==None:
-                match=pattern2.search(line)
-            if match!=None:
-                break
-        if match!=None:
-            break
-        time.sleep(0.5)
-    if match==None:
-        return ""
-    value=match.group("value")
-    SendCommand(setting.upper()+" "+value)
-    return value.strip()
+    Settings.WatchServerlog(Global.serverlog)
+    Settings.Refresh(setting).wait(timeout)
+    return Settings.Get(setting, "")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+## @file CommandQueue.py
+# @package CommandQueue
+# @brief Execution of chat commands
+# @details This file contains a fixed number of worker threads that execute chat commands.
+#          Commands of the same player are executed in order, one after another. Each player
+#          can only have a limited number of commands waiting.
+
+import logging
+import threading
+import time
+from collections import deque
+
+__save_vars=["log", "pool"]
+
+## @brief The logging object
+# @private
+# @details Used for logging by this module
+# @note To enable or disable logging of this module use \link CommandQueue.enableLogging\endlink
+log=logging.getLogger("CommandQueueModule")
+log.addHandler(logging.NullHandler() )
+
+## @brief Default number of worker threads.
+# @details This is the maximal number of commands that run at the same time.
+default_workers=4
+
+## @brief Default number of commands a player can have waiting.
+default_max_per_player=3
+
+## @brief Default number of commands that can wait in total.
+default_max_queued=64
+
+## @class CommandQueue.Pool
+# @brief Worker threads with per player queues
+class Pool:
+    ## @property queues
+    # @brief Waiting commands
+    # @details Dictionary of deques of (time, func, args) tuples, where the player is the key.
+    #          The command that is running isn't in the deque anymore, but the deque is kept
+    #          until it finished.
+
+    ## @property ready
+    # @brief Players whose next command can be started.
+    # @details A player is in here at most once, so commands of a player never run in parallel.
+
+    ## @property latencies
+    # @brief Seconds the last commands had to wait before they were started.
+
+    def __init__(self, workers=default_workers, max_per_player=default_max_per_player,
+                 max_queued=default_max_queued):
+        self.max_per_player=max_per_player
+        self.max_queued=max_queued
+        self.queues=dict()
+        self.ready=deque()
+        self.queued=0
+        self.running=0
+        self.submitted=0
+        self.rejected=0
+        self.completed=0
+        self.failed=0
+        self.max_depth=0
+        self.latencies=deque(maxlen=1000)
+        self.changed=threading.Condition()
+        self.workers=[]
+        for i in range(workers):
+            t=threading.Thread(target=self.work, name="CommandWorker"+str(i))
+            t.daemon=True
+            t.start()
+            self.workers.append(t)
+
+    ## @brief Adds a command.
+    # @return True if the command was queued, False if the player or the pool has too many
+    #         commands waiting.
+    def submit(self, player, func, args):
+        with self.changed:
+            queue=self.queues.get(player)
+            if (queue!=None and len(queue)>=self.max_per_player) or self.queued>=self.max_queued:
+                self.rejected+=1
+                return False
+            if queue==None:
+                queue=deque()
+                self.queues[player]=queue
+                self.ready.append(player)
+            queue.append((time.monotonic(), func, args))
+            self.queued+=1
+            self.submitted+=1
+            self.max_depth=max(self.max_depth, self.queued)
+            self.changed.notify()
+        return True
+
+    ## @brief Main loop of a worker thread.
+    # @private
+    def work(self):
+        while True:
+            with self.changed:
+                while not self.ready:
+                    self.changed.wait()
+                player=self.ready.popleft()
+                queued_at, func, args=self.queues[player].popleft()
+                self.queued-=1
+                self.running+=1
+                self.latencies.append(time.monotonic()-queued_at)
+            failed=False
+            try:
+                func(*args)
+            except Exception:
+                failed=True
+                log.exception("Command "+str(getattr(func, "__name__", func))+" of player "+str(player)+" failed.")
+            with self.changed:
+                self.running-=1
+                self.completed+=1
+                if failed:
+                    self.failed+=1
+                queue=self.queues[player]
+                if queue:
+                    self.ready.append(player) # Next command of that player, after the others.
+                    self.changed.notify()
+                else:
+                    del self.queues[player]
+
+    ## @brief Returns statistics.
+    def stats(self):
+        with self.changed:
+            latencies=sorted(self.latencies)
+            ret={"workers": len(self.workers), "running": self.running, "queued": self.queued,
+                 "max_queued": self.max_depth, "players": len(self.queues),
+                 "submitted": self.submitted, "rejected": self.rejected,
+                 "completed": self.completed, "failed": self.failed}
+        if latencies:
+            ret["latency_p50"]=latencies[len(latencies)//2]
+            ret["latency_p99"]=latencies[min(len(latencies)-1, len(latencies)*99//100)]
+            ret["latency_max"]=latencies[-1]
+        return ret
+
+## @brief The pool used by Submit.
+# @details Created when the first command is submitted.
+pool=None
+
+## @brief Executes a command in a worker thread.
+# @details Commands of the same player are executed in the order they were submitted.
+# @param player The ladder name of the player who executes the command.
+# @param func The function to call.
+# @param *args The arguments to pass to the function.
+# @return True if the command was queued, False if it was rejected because too many
+#         commands are waiting.
+def Submit(player, func, *args):
+    global pool
+    if pool==None:
+        pool=Pool()
+    return pool.submit(player, func, args)
+
+## @brief Returns statistics about the executed commands.
+# @return A dictionary with the number of workers, running, queued, submitted, rejected,
+#         completed and failed commands and the p50, p99 and maximal latency in seconds.
+def Stats():
+    if pool==None:
+        return dict()
+    return pool.stats()
+
+## @brief Enables logging
+# @details This function enables logging for this module.
+# @param h The handler used for logging
+# @param f The formatter used for logging
+# @param level The logging level
+def enableLogging(level=logging.DEBUG, h=None,f=None):
+    global log
+    log.setLevel(level)
+    if not h:
+        h=logging.StreamHandler()
+        h.setLevel(level)
+    if not f:
+        f=logging.Formatter("[%(name)s] (%(asctime)s) %(levelname)s: %(message)s")
+    h.setFormatter(f)
+    for handler in log.handlers:
+        if type(handler)==type(h):
+            log.removeHandler(handler)
+    log.addHandler(h)
@@ -12,6 +12,9 @@ import Poll
 import tools
 import Global
 import inspect
+import bisect
+import functools
+import threading
 
 __save_vars=["disabled","data"]
 ###################################### VARIABLES #########################################
@@ -29,6 +32,10 @@ disabled=[]
 # @details Data that is only need for a specific state.
 data=None
 
+## @brief Protects the registration of commands and help topics
+# @details Extensions may be imported in parallel.
+lock=threading.RLock()
+
 ## @brief Help topics
 helpTopics= {
               "about": ("About this script",Messages.About, 20),
@@ -39,8 +46,137 @@ helpTopics= {
 commands=dict()
 commandvalues=dict()
 
+## @brief Index of the commands
+# @details Dictionary of the real command names, where the lowercase command name or
+#          alias is the key.
+commandIndex=dict()
+
+## @brief Names of each command
+# @details Dictionary of sets of the lowercase names and aliases in commandIndex, where the
+#          real command name is the key.
+# @private
+commandNames=dict()
+
+## @brief Help lists of the commands
+# @details Dictionary of (path, list) tuples of the help group a command was registered to,
+#          where the command is the key.
+# @private
+commandListings=dict()
+
+## @brief What each package registered
+# @details Dictionary of (commands, help topics) tuples, where the lowercase package name
+#          (see tools.get_package) is the key. commands is a set of command names and help
+#          topics a list of paths of help topics. Used by unregister_package.
+# @private
+packageRegistry=dict()
+
+## @brief The package the current thread is loading
+# @details Help topics registered meanwhile belong to this package. Set with setOwner().
+# @private
+owner=threading.local()
+
+## @brief Sorted list of the keys of commandIndex.
+# @details Used for prefix completion.
+sortedNames=[]
+
+## @brief Cache of rendered usage and help
+# @details Dictionary of the results of the functions decorated with cachedHelp, where
+#          (function name, command, access level) is the key.
+helpCache=dict()
+
+## @brief AccessLevel.generation for which helpCache was filled.
+helpCacheGeneration=None
+
+## @brief Help topics visible for each access level
+# @details Dictionary of views, where the access level is the key. A view is a dictionary
+#          of (label, data) tuples, where the path of the topic as a tuple is the key. data is
+#          a dictionary of the labels of the visible subtopics, a list of the visible
+#          commands, a text or a function which returns the topic when it's shown.
+# @note Views are built by getHelpView() and kept up to date by updateHelpViews().
+helpViews=dict()
+
+## @brief AccessLevel.generation for which helpViews were built.
+helpViewsGeneration=None
+
 ###################################### COMMAND HELPERS ###################################
 
+## @brief Caches the result of a help function.
+# @details The result is cached for each command and access level. The cache is cleared
+#          when an access level changes or commands are registered or unregistered.
+def cachedHelp(func):
+    @functools.wraps(func)
+    def cached(command, acl=0):
+        global helpCacheGeneration
+        if helpCacheGeneration!=AccessLevel.generation:
+            helpCache.clear()
+            helpCacheGeneration=AccessLevel.generation
+        key=(func.__name__, command, int(acl))
+        if key not in helpCache:
+            helpCache[key]=func(command, acl)
+        return helpCache[key]
+    return cached
+
+## @brief Clears the help cache.
+# @details Must be called when commandvalues changes.
+def clearHelpCache():
+    helpCache.clear()
+
+## @brief Adds a name to the command index.
+# @private
+def indexCommand(name, command):
+    name=name.lower()
+    if name not in commandIndex:
+        bisect.insort(sortedNames, name)
+    elif commandIndex[name] in commandNames:
+        commandNames[commandIndex[name]].discard(name)
+    commandIndex[name]=command
+    commandNames.setdefault(command, set()).add(name)
+
+## @brief Removes a command and its aliases from the command index.
+# @private
+def unindexCommand(command):
+    for name in commandNames.pop(command, ()):
+        del commandIndex[name]
+        del sortedNames[bisect.bisect_left(sortedNames, name)]
+
+## @brief Finds a command.
+# @details Case insensitive lookup of a command name or alias.
+# @param name The name of the command or an alias.
+# @return The real name of the command or None if there is no such command.
+def findCommand(name):
+    return commandIndex.get(name.lower())
+
+## @brief Completes a command name.
+# @details Disabled commands are never returned.
+# @param prefix The beginning of the command name.
+# @param limit Optional The maximal number of results.
+# @param access Optional Only return commands that are allowed for this access level.
+# @return Sorted list of the real names of the commands which names or aliases start with prefix.
+def completeCommand(prefix, limit=None, access=None):
+    prefix=prefix.lower()
+    ret=[]
+    i=bisect.bisect_left(sortedNames, prefix)
+    while i<len(sortedNames) and not (limit and len(ret)>=limit):
+        name=sortedNames[i]
+        i+=1
+        if not name.startswith(prefix):
+            break
+        command=commandIndex[name]
+        if command in ret or command in disabled:
+            continue
+        if access!=None and not AccessLevel.isAllowed(command, access):
+            continue
+        ret.append(command)
+    return ret
+
+## @brief Adds an alias for a command.
+# @param alias The alias.
+# @param command The name of the command.
+# @exception RuntimeError Raised if the command doesn't exist.
+def register_alias(alias, command):
+    indexCommand(alias, getRealCommand(command))
+
+@cachedHelp
 def getDescription(command, acl):
     if command not in commands:
         command=getRealCommand(command)
@@ -51,10 +187,9 @@ def getDescription(command, acl):
     params=desc[1]
     ident_param=2
     ident_param_desc=10
+    param_acls=AccessLevel.getParamAccessLevels(command)
     for param in params:
-        acl_needed=float("inf")
-        if AccessLevel.accessLevelSet(command.lower()+"_param_"+param[0].lower()):
-            acl_needed=AccessLevel.getAccessLevel(command.lower()+"_param_"+param[0].lower())
+        acl_needed=param_acls.get(param[0].lower(), float("inf"))
         if not acl_needed>=acl:
             continue
         paramstr=paramstr+"\n"+" "*ident_param
@@ -109,17 +244,48 @@ def initCommand(command):
         defaultvalues={argname:defaultvalue for argname, defaultvalue in zip(reversed(argspec.args), argspec.defaults)}
     desc=getDescriptionInit(command, names)
     commandvalues[command]=minargs, maxargs, defaultvalues, names, desc
+    clearHelpCache()
     return
 
+## @brief Sets the help of a command without looking at its function.
+# @details Used for commands whose function only forwards the parameters, like the
+#          placeholders of lazy extensions.
+# @param command The name of the command.
+# @param brief The description of the command.
+# @param args The names of the parameters, like in the definition of the function.
+#             Optional parameters are given as "name=default", the last one may be "*name".
+# @param params Dictionary of the descriptions of the parameters, where the name is the key.
+def describeCommand(command, brief="Not documented", args=(), params=dict()):
+    if command not in commands:
+        command=getRealCommand(command)
+    minargs, maxargs, defaultvalues, names=0, 0, dict(), []
+    for arg in args:
+        if arg.startswith("*"):
+            names.append(arg[1:])
+            maxargs=float("inf")
+            break
+        name, optional, default=arg.partition("=")
+        names.append(name)
+        maxargs+=1
+        if optional:
+            defaultvalues[name]=default
+        else:
+            minargs+=1
+    desc=brief, [(name, params[name]) for name in names if name in params]
+    with lock:
+        commandvalues[command]=minargs, maxargs, defaultvalues, names, desc
+        clearHelpCache()
+
 ## @brief Gets the parameter of a command
 # @details Gets the parameter of the given command from the function definition.
 # @param command The name of the command
 # @return A tuple of (minargcount, maxargcount, defaultvalues, names)
+@cachedHelp
 def getArgs(command,acl):
     if command not in commands:
         command=getRealCommand(command)
     minargcount, maxargcount, defaultvalues, names=commandvalues[command][:4]
-    allowed=lambda i: not AccessLevel.accessLevelSet(command.lower()+"_param_"+i.lower()) or AccessLevel.isAllowed(command.lower()+"_param_"+i, acl)
+    allowed=lambda i: AccessLevel.isParamAllowed(command, i, acl)
     optionalargs=names[minargcount:]
     newnames=[]
     for name in names:
@@ -132,7 +298,7 @@ def getArgs(command,acl):
             maxargcount-=1
         else:
             newnames.append(name)
-    return minargcount, maxargcount, defaultvalues, newnames
+    return minargcount, maxargcount, defaultvalues, tuple(newnames)
 
 def init():
     global commands
@@ -163,6 +329,7 @@ def getCommands():
 # @details Retuns the command line for the given command.
 # @param command The command for which to get the command line.
 # @return The command line.
+@cachedHelp
 def getCommandLine(command, acl=0):
     if command not in commands:
         command=getRealCommand(command)
@@ -191,6 +358,7 @@ def getCommandLine(command, acl=0):
 # @details Returns a help message for the given command
 # @param command The command for which to generate the help message.
 # @return The help message
+@cachedHelp
 def getHelp(command, acl):
     commandstr=getCommandLine(command,acl)
     commanddesc, params=getDescription(command,acl)
@@ -201,20 +369,27 @@ def getHelp(command, acl):
 # @details Register new functions to be used as commands.
 # @param *functions Functions to register.
 def register_commands(*functions, group=None):
-    if group:
-        try:
-            a=get_help_topic("commands",group)
-        except ValueError as v:
-            import sys
-            sys.stderr.write(str(helpTopics))
-            raise v
-            return
-    global commands
-    for func in functions:
-        commands[func.__name__]=func
-        initCommand(func.__name__)
-        if func.__name__ not in a[1]:
-            a[1].append(func.__name__)
+    with lock:
+        if group:
+            try:
+                a=get_help_topic("commands",group)
+            except ValueError as v:
+                import sys
+                sys.stderr.write(str(helpTopics))
+                raise v
+                return
+        global commands
+        for func in functions:
+            commands[func.__name__]=func
+            indexCommand(func.__name__, func.__name__)
+            initCommand(func.__name__)
+            getPackageRegistry(tools.get_package(func))[0].add(func.__name__)
+            if group:
+                if func.__name__ not in a[1]:
+                    a[1].append(func.__name__)
+                commandListings[func.__name__]=("commands", group), a[1]
+        if group:
+            updateHelpViews(("commands", group))
 
 def get_help_topic(*path):
     global helpTopics
@@ -254,37 +429,101 @@ def find_help_topic_applies(func,apply_on=[list],curtopic=None):
     else:
         return tools.remove_duplicates(ret)
 
+## @brief Finds the help list that contains a command.
+# @private
+# @return The (path, list) tuple, or None if no list contains the command.
+def findCommandListing(name, path=(), topic=None):
+    if topic==None:
+        topic=helpTopics
+    if type(topic)==tuple:
+        topic=topic[1]
+    if type(topic)==list:
+        return (path, topic) if name in topic else None
+    if type(topic)==dict:
+        for subname, subtopic in topic.items():
+            listing=findCommandListing(name, path+(subname,), subtopic)
+            if listing!=None:
+                return listing
+    return None
+
 def add_help_group(group, desc):
     register_help("commands "+group, desc, [])
     
 def unregister_command(name):
-    if not name.lower() in [i.lower() for i in getCommands()]:
-        raise RuntimeError("No command "+name+ " to unregister.")
-    name=getRealCommand(name)
-    command_listing=find_help_topic_applies(lambda x: name in x, apply_on=[list])
-    if not command_listing:
-        raise RuntimeError("No command "+name+ " to unregister.")
-    else:
-        command_listing[0].remove(name)
-    global commands
-    global commandvalues
-    del commands[name]
-    del commandvalues[name.lower()]
-
+    with lock:
+        if findCommand(name)==None:
+            raise RuntimeError("No command "+name+ " to unregister.")
+        name=getRealCommand(name)
+        command_listing=commandListings.pop(name, None)
+        if command_listing==None or name not in command_listing[1]:
+            command_listing=findCommandListing(name)
+        if command_listing!=None:
+            path, listing=command_listing
+            listing.remove(name)
+            updateHelpViews(path)
+        global commands
+        global commandvalues
+        registry=packageRegistry.get(tools.get_package(commands[name]).lower())
+        if registry:
+            registry[0].discard(name)
+        del commands[name]
+        del commandvalues[name]
+        unindexCommand(name)
+        clearHelpCache()
+
+## @brief Gets the real name of a command.
+# @param x The name of the command or an alias, in any case.
+# @exception RuntimeError Raised if there is no such command.
 def getRealCommand(x):
-    x=x.lower()
     try:
-        return [command for command in commands if command.lower()==x][0]
-    except:
-        raise RuntimeError("No command "+command)
-
+        return commandIndex[x.lower()]
+    except KeyError:
+        raise RuntimeError("No command "+x)
+
+## @brief Gets what a package registered.
+# @private
+# @return The (commands, help topics) tuple in packageRegistry. It's added if it doesn't exist.
+def getPackageRegistry(package):
+    return packageRegistry.setdefault(package.lower(), (set(), []))
+
+## @brief Sets the package the current thread is loading.
+# @details Help topics registered by this thread until the owner is set to None belong
+#          to the package and are removed by unregister_package.
+# @param package The name of the package, or None.
+def setOwner(package):
+    owner.package=package
+
+## @brief Removes all commands and help topics of a package.
+# @details Takes time proportional to what the package registered.
+# @param name The name of the package.
 def unregister_package(name):
-    command_topics=find_help_topic_applies(lambda x: any((y for y in x if tools.get_package(commands[getRealCommand(y)]).lower()==name.lower())), apply_on=[list])
-    if not command_topics:
-        return
-    for topic in command_topics:
-        for command in [i for i in topic if tools.get_package(commands[getRealCommand(i)]).lower()==name.lower()]:
-            unregister_command(command)
+    with lock:
+        registry=packageRegistry.pop(name.lower(), None)
+        if not registry:
+            return
+        commands_registered, help_topics=registry
+        for command in list(commands_registered):
+            if command in commands:
+                unregister_command(command)
+        for path in reversed(help_topics):
+            unregister_help(path)
+
+## @brief Removes a help topic.
+# @details Help lists that still contain commands of others are kept.
+# @param path The path of the topic as a list.
+def unregister_help(path):
+    with lock:
+        try:
+            h=get_help_topic(*path[:-1])
+        except ValueError:
+            return
+        if type(h)!=tuple or type(h[1])!=dict or path[-1] not in h[1]:
+            return
+        topic=h[1][path[-1]]
+        if type(topic)==tuple and type(topic[1])==list and topic[1]:
+            return
+        del h[1][path[-1]]
+        updateHelpViews(path)
         
 ## @brief Register a help topic for commands or other things.
 #  @details Add a new help topic.
@@ -294,21 +533,144 @@ def unregister_package(name):
 #  @param access Optional The access level which is required to see this help topic (Useful for data types text and function)
 #  @param override Override existing topics?
 def register_help(name,label, data, access=None, override=False):
-    global helpTopics
-    h=get_help_topic(*name.split()[:-1])
-    if type(h)!=tuple:
-        return
-    if type(h[1]) == dict:
-        name=name.split()[-1]
-        if name in h[1] and not override:
+    with lock:
+        global helpTopics
+        path=name.split()
+        h=get_help_topic(*path[:-1])
+        if type(h)!=tuple:
             return
-        if not access:
-            h[1][name]=(label, data)
+        if type(h[1]) == dict:
+            name=name.split()[-1]
+            if name in h[1] and not override:
+                return
+            if not access:
+                h[1][name]=(label, data)
+            else:
+                h[1][name]=(label, data, access)
+            if getattr(owner, "package", None):
+                getPackageRegistry(owner.package)[1].append(path[:-1]+[name])
+            updateHelpViews(path[:-1]+[name])
         else:
-            h[1][name]=(label, data, access)
+            return
+
+## @brief Gets the label of a help topic.
+# @return The label, or None if the topic is a function.
+def getHelpLabel(topic):
+    if type(topic)==tuple:
+        return topic[0]
+    elif hasattr(topic, "__call__"):
+        return None
+    return ""
+
+## @brief Adds the entries of a help topic to a view.
+# @details Adds the topic and all of its subtopics that are visible with the given access level.
+# @param path The path of the topic as a tuple.
+# @param topic The topic.
+# @param acl The access level.
+# @param view The view to which to add the entries.
+# @return True if the topic is visible, False otherwise.
+def buildHelpEntries(path, topic, acl, view):
+    label=""
+    acl_needed=0
+    if type(topic)==tuple:
+        if len(topic)>2:
+            acl_needed=topic[2]
+            if acl_needed<acl:
+                return False
+        label=topic[0]
+        topic=topic[1]
+    if hasattr(topic, "__call__"):
+        view[path]=(label, topic) # Called when it's shown.
+        return True
+    if type(topic)==dict:
+        data=dict()
+        for subname, subtopic in topic.items():
+            if buildHelpEntries(path+(subname,), subtopic, acl, view):
+                data[subname]=getHelpLabel(subtopic)
+    elif type(topic)==list:
+        data=[command for command in topic if AccessLevel.isAllowed(command, acl)]
+    elif type(topic)==str and acl<=acl_needed:
+        data=topic
     else:
-        return
-    
+        data=None
+    if not data:
+        return False
+    view[path]=(label, data)
+    return True
+
+## @brief Gets the help topics visible for an access level.
+# @details The view is built on first use and then kept up to date.
+# @param acl The access level.
+# @return The view. See helpViews.
+def getHelpView(acl):
+    global helpViewsGeneration
+    if helpViewsGeneration!=AccessLevel.generation:
+        helpViews.clear()
+        helpViewsGeneration=AccessLevel.generation
+    acl=int(acl)
+    if acl not in helpViews:
+        view=dict()
+        buildHelpEntries((), helpTopics, acl, view)
+        helpViews[acl]=view
+    return helpViews[acl]
+
+## @brief Updates a help topic in all views.
+# @details Rebuilds the entries of the given topic and its subtopics in every view and
+#          adds it to or removes it from its parents. Must be called when a help topic changes.
+# @param path The path of the topic which changed.
+def updateHelpViews(path):
+    path=tuple(path)
+    try:
+        topic=get_help_topic(*path)
+    except ValueError:
+        topic=None
+    for acl, view in list(helpViews.items()):
+        for key in [key for key in view if key[:len(path)]==path]:
+            del view[key]
+        visible=topic!=None and buildHelpEntries(path, topic, acl, view)
+        # Fix the parents
+        for i in range(len(path), 0, -1):
+            name=path[i-1]
+            parent=view.get(path[:i-1])
+            if visible:
+                if parent!=None:
+                    parent[1][name]=getHelpLabel(get_help_topic(*path[:i]))
+                    break
+                parent_topic=get_help_topic(*path[:i-1])
+                view[path[:i-1]]=(getHelpLabel(parent_topic), {name: getHelpLabel(get_help_topic(*path[:i]))})
+            else:
+                if parent==None or name not in parent[1]:
+                    break
+                del parent[1][name]
+                if len(parent[1]):
+                    break
+                del view[path[:i-1]]
+
+## @brief Drops all help views.
+# @details They are built again when they are used the next time.
+def clearHelpViews():
+    helpViews.clear()
+
+## @brief Looks up a help topic in a view.
+# @details Functions on the path are called to get the topic.
+# @param view The view. See getHelpView.
+# @param path The path of the topic as a tuple.
+# @param acl The access level of the view.
+# @return A tuple (label, data) or None if the topic isn't visible.
+def lookupHelpTopic(view, path, acl):
+    for i in range(len(path), -1, -1):
+        entry=view.get(path[:i])
+        if entry==None:
+            continue
+        if not hasattr(entry[1], "__call__"):
+            return entry if i==len(path) else None
+        resolved=dict()
+        if not buildHelpEntries(path[:i], entry[1](), int(acl), resolved):
+            return None
+        if i==len(path) and not resolved[path][0]:
+            resolved[path]=(entry[0], resolved[path][1])
+        return resolved.get(path)
+    return None
 
 ###################################### COMMANDS ##########################################
 #Empty line NEEDED
@@ -368,74 +730,32 @@ def info(acl, player, *topics):
     try:
         commandname=" ".join(topics)
         if commandname.startswith("/"): commandname=commandname[1:]
-        commandname_real=[i for i in getCommands() if i.lower()==commandname][0]
+        commandname_real=getRealCommand(commandname)
         Armagetronad.PrintPlayerMessage(player, getHelp(commandname_real,acl) )
         return
-    except IndexError:
+    except RuntimeError:
         pass
     acl=int(acl)
-    def checkAclTopics(topic2):
-        if hasattr(topic2,"__call__"):
-            topic2=topic2()
-        if type(topic2)==tuple:
-            if len(topic2)>2:
-                acl_needed=topic2[2]
-                if acl_needed<acl:
-                    return None
-            else:
-                acl_needed=0
-            topic=topic2[1]
-        else:
-            topic=topic2
-        if type(topic)==dict:
-            ret=dict()
-            for subtopic in topic:
-                newtopic=checkAclTopics(topic[subtopic])
-                if newtopic!=None:
-                    ret[subtopic]=newtopic
-        elif type(topic)==list:
-            ret=[]
-            for command in topic:
-                if AccessLevel.isAllowed(command,acl):
-                    ret+=[command]
-        elif type(topic)==str:
-            if acl<=acl_needed: ret=topic
-            else:               ret=""
-        if len(ret): 
-            if type(topic2)==tuple:
-                ret=topic2[0:1]+(ret,)+topic2[2:]
-            return ret
-        else:        
-            return None
-
-    curtopic=checkAclTopics(helpTopics)
-    for topicname in topics:
-        if type(curtopic)==tuple:
-            curtopic=curtopic[1]
-        if hasattr(curtopic,"__call__"):
-            curtopic=curtopic()
-        if topicname in curtopic:
-            if type(curtopic)==dict:
-                curtopic=curtopic[topicname]
-            elif type(curtopic)==list:
-                curtopic=getHelp(topicname, acl)
-        else:
+    view=getHelpView(acl)
+    curtopic=lookupHelpTopic(view, topics, acl)
+    if curtopic==None and len(topics):
+        # The last topic may be a command in a list of commands.
+        parent=lookupHelpTopic(view, topics[:-1], acl)
+        if parent!=None and type(parent[1])==list and topics[-1] in parent[1]:
+            curtopic=("", getHelp(topics[-1], acl))
+    if curtopic==None:
+        if len(topics):
             Armagetronad.PrintPlayerMessage(player, Messages.InfoTopicInvalid.format(topic=" ".join(topics)) )
-            return
-    if type(curtopic)==tuple:
-        topic_desc=curtopic[0] #@UnusedVariable
-        curtopic=curtopic[1]
-    else:
-        topic_desc="" #@UnusedVariable
-    if hasattr(curtopic, "__call__"):
-        curtopic=curtopic()
+        else:
+            Armagetronad.PrintPlayerMessage(player, "0xff0000ERROR No topics available.")
+        return
+    topic_desc, curtopic=curtopic #@UnusedVariable
     if type(curtopic)==dict:
         Armagetronad.PrintPlayerMessage(player, "0x8888ffTo get help about one of the following topics, use 0xffff00/info "+" ".join(topics)+" <subtopic_name>")
-        for topicname, value in curtopic.items() :
-            if type(value)==tuple:
-                desc=value[0]
-            else:
-                desc=""
+        for topicname, desc in list(curtopic.items()):
+            if desc==None:
+                subtopic=lookupHelpTopic(view, topics+(topicname,), acl)
+                desc=subtopic[0] if subtopic!=None else ""
             Armagetronad.PrintPlayerMessage(player, "0x00ff88"+" ".join(topics)+" "+topicname+": 0xffffff"+desc)
     elif type(curtopic)==str:
         Armagetronad.PrintPlayerMessage(player, curtopic)
@@ -470,30 +790,46 @@ def acl(acl, player, command, access=None):
     AccessLevel.setAccessLevel(command, access)
     Armagetronad.PrintPlayerMessage(player, Messages.AccessLevelChanged.format(command=command, access=access) )
     
-## @brief Vote for the current poll
-def yes(acl, player):
-    if not Poll.current_poll:
-        Armagetronad.PrintPlayerMessage(player, Messages.NoActivePoll)
+## @brief Finds the poll for which a player wants to vote.
+# @details Prints a message to the player if there's no such poll.
+# @param player The ladder name of the player.
+# @param poll_id The id of the poll or None for the current poll.
+# @return The Poll or None.
+def findPoll(player, poll_id):
+    poll=Poll.Get(poll_id)
+    if poll==None:
+        if poll_id==None or not Poll.polls:
+            Armagetronad.PrintPlayerMessage(player, Messages.NoActivePoll)
+        else:
+            Armagetronad.PrintPlayerMessage(player, Messages.PollNotExist.format(id=poll_id))
+    return poll
+
+## @brief Vote for a poll
+# @param poll_id The id of the poll. If not given, vote for the poll that was added last.
+def yes(acl, player, poll_id=None):
+    poll=findPoll(player, poll_id)
+    if not poll:
         return
     try:
-        Poll.current_poll.SetPlayerVote(player, True)
-        Armagetronad.PrintMessage( Messages.PlayerVotedYes.format(player=Player.players[player].name, target=Poll.current_poll.target) )
-        Poll.current_poll.CheckResult(only_sure=True)
+        poll.SetPlayerVote(player, True)
+        Armagetronad.PrintMessage( Messages.PlayerVotedYes.format(player=Player.players[player].name, target=poll.target) )
+        poll.CheckResult(only_sure=True)
     except RuntimeError as r:
         if r.args[1]==1:
             Armagetronad.PrintPlayerMessage(player, Messages.PlayerAlreadyVoted)
         elif r.args[1]==2:
             Armagetronad.PrintPlayerMessage(player, Messages.SpecNotAllowed)
 
-## @brief Vote against the current poll
-def no(acl, player):
-    if not Poll.current_poll:
-        Armagetronad.PrintPlayerMessage(player, Messages.NoActivePoll)
+## @brief Vote against a poll
+# @param poll_id The id of the poll. If not given, vote against the poll that was added last.
+def no(acl, player, poll_id=None):
+    poll=findPoll(player, poll_id)
+    if not poll:
         return
     try:
-        Poll.current_poll.SetPlayerVote(player, False)
-        Armagetronad.PrintMessage( Messages.PlayerVotedNo.format(player=Player.players[player].name, target=Poll.current_poll.target) )
-        Poll.current_poll.CheckResult(only_sure=True)
+        poll.SetPlayerVote(player, False)
+        Armagetronad.PrintMessage( Messages.PlayerVotedNo.format(player=Player.players[player].name, target=poll.target) )
+        poll.CheckResult(only_sure=True)
     except RuntimeError as r:
         if r.args[1]==1:
             Armagetronad.PrintPlayerMessage(player, Messages.PlayerAlreadyVoted)
@@ -501,11 +837,17 @@ def no(acl, player):
             Armagetronad.PrintPlayerMessage(player, Messages.SpecNotAllowed)
 
 ## @brief Cancel all currently active polls.
-def cancel(acl, player):
-    if not Poll.current_poll:
-        Armagetronad.PrintPlayerMessage(player, Messages.NoActivePoll)
+# @param poll_id The id of the poll to cancel. If not given, all polls are cancelled.
+def cancel(acl, player, poll_id=None):
+    if poll_id==None:
+        if not Poll.polls:
+            Armagetronad.PrintPlayerMessage(player, Messages.NoActivePoll)
+            return
+        Poll.Cancel()
         return
-    Poll.Cancel()
+    poll=findPoll(player, poll_id)
+    if poll:
+        Poll.Cancel(poll)
 
 ## @brief Reload the script.
 def reload_script(acl, player):
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+## @file Formation.py
+# @package Formation
+# @brief Spawn positions of team members
+# @details This file computes where the members of teams are spawned. The positions of all
+#          teams are computed at once, with numpy if it's installed.
+
+import math
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+## @brief The available formations
+# @details Dictionary of functions that return the position of every member relative to the
+#          spawn point, where the name of the formation is the key. x is sideways and y is
+#          the direction in which the team drives.
+shapes=dict()
+
+## @brief Formation used if none is given.
+default_shape="zigzag"
+
+## @brief Adds a formation
+# @details Decorator. The function gets the number of members, the offset between the rows
+#          and the shift between the players of a row. It returns a list of (x, y) tuples.
+# @param name The name of the formation.
+def shape(name):
+    def register(func):
+        shapes[name]=func
+        return func
+    return register
+
+## @brief The leader in front, the others alternating left and right behind the leader.
+@shape("zigzag")
+def zigzag(count, offset, shift):
+    ret=[]
+    for i in range(count):
+        row=(i+1)//2
+        factor=-1 if i%2==1 else 1
+        ret.append((row*shift*factor, -row*offset))
+    return ret
+
+## @brief All members side by side.
+@shape("line")
+def line(count, offset, shift):
+    return [((i-(count-1)/2)*shift, 0) for i in range(count)]
+
+## @brief Rows that get wider, the leader in front.
+@shape("wedge")
+def wedge(count, offset, shift):
+    ret=[]
+    row=0
+    while len(ret)<count:
+        for i in range(min(row+1, count-len(ret))):
+            ret.append(((i-row/2)*shift, -row*offset))
+        row+=1
+    return ret
+
+## @brief A circle around the spawn point.
+@shape("circle")
+def circle(count, offset, shift):
+    if count==1:
+        return [(0, 0)]
+    radius=max(shift*count/(2*math.pi), shift)
+    return [(radius*math.sin(2*math.pi*i/count), radius*math.cos(2*math.pi*i/count)) for i in range(count)]
+
+## @brief Gets the positions relative to the spawn point.
+# @param count The number of members.
+# @param offset The offset between the rows.
+# @param shift The offset between the players of a row.
+# @param shape The name of the formation.
+# @exception KeyError Raised if the formation doesn't exist.
+def getOffsets(count, offset, shift, shape=None):
+    if shape==None:
+        shape=default_shape
+    return shapes[shape](count, offset, abs(shift))
+
+## @brief Computes the spawn positions of several teams.
+# @details The positions relative to the spawn point are rotated so that the front of the
+#          formation looks in the driving direction.
+# @param spawns List of (count, x, y, xdir, ydir, offset, shift, shape) tuples, one for each
+#               team. shape may be None for the default formation.
+# @return List of lists of (x, y) tuples, one list for each spawn.
+def compute(spawns):
+    local=[getOffsets(count, offset, shift, shape) for count, x, y, xdir, ydir, offset, shift, shape in spawns]
+    if numpy!=None:
+        return __computeNumpy(spawns, local)
+    ret=[]
+    for (count, x, y, xdir, ydir, offset, shift, shape), offsets in zip(spawns, local): #@UnusedVariable
+        hyp=math.hypot(xdir, ydir)
+        cosa=ydir/hyp
+        sina=xdir/hyp
+        ret.append([(x+cosa*rx+sina*ry, y-sina*rx+cosa*ry) for rx, ry in offsets])
+    return ret
+
+## @brief Same as compute(), using numpy.
+# @private
+def __computeNumpy(spawns, local):
+    counts=[len(offsets) for offsets in local]
+    if not sum(counts):
+        return [[] for i in spawns]
+    params=numpy.repeat(numpy.array([spawn[1:5] for spawn in spawns], dtype=float), counts, axis=0)
+    offsets=numpy.array([pos for offsets in local for pos in offsets], dtype=float)
+    hyp=numpy.hypot(params[:,2], params[:,3])
+    cosa=params[:,3]/hyp
+    sina=params[:,2]/hyp
+    xs=params[:,0]+cosa*offsets[:,0]+sina*offsets[:,1]
+    ys=params[:,1]-sina*offsets[:,0]+cosa*offsets[:,1]
+    positions=list(zip(xs.tolist(), ys.tolist()))
+    ret=[]
+    start=0
+    for count in counts:
+        ret.append(positions[start:start+count])
+        start+=count
+    return ret
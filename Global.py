@@ -15,7 +15,8 @@ def reloadPlayerList():
     Armagetronad.SendCommand("CYCLE_RUBBER -1")
     sleep(1)
     Armagetronad.SendCommand("CYCLE_RUBBER 1")
-    Armagetronad.SendCommand("CYCLE_RUBBER "+rubber)
+    if rubber!="":
+        Armagetronad.SendCommand("CYCLE_RUBBER "+rubber)
     Armagetronad.SendCommand("SINCLUDE settings_custom.cfg")
 
 ## @brief Reloads all modules used by this script
@@ -32,8 +33,10 @@ def set_script_settings():
 # @details Possible values are "normal" or "modeeditor".
 state="normal"
 not_a_setting=("CONSOLE_MESSAGE", "CENTER_MESSAGE", "SAY", "QUIT", "EXIT", "SPAWN_ZONE", 
-           "COLLAPSE_ZONE", "TELEPORT_PLAYER", "RESPAWN_PLAYER", "KICK", "SUSPEND", "SILENCE"
-           "ADD_HELP_TOPIC", "REMOVE_HELP_TOPIC", "PLAYER_MESSAGE", "UNBAN_IP","UNSUSPEND", "UNBAN_USER")
+           "COLLAPSE_ZONE", "TELEPORT_PLAYER", "RESPAWN_PLAYER", "KICK", "SUSPEND", "SILENCE",
+           "ADD_HELP_TOPIC", "REMOVE_HELP_TOPIC", "PLAYER_MESSAGE", "UNBAN_IP","UNSUSPEND", "UNBAN_USER",
+           "KILL", "RENAME", "ALLOW_RENAME_PLAYER", "DISALLOW_RENAME_PLAYER", "INCLUDE", "SINCLUDE",
+           "START_NEW_MATCH", "ROUND_CONSOLE_MESSAGE")
 not_a_setting_prefixes=("SPAWN_","REMOVE")
 supportedCommands=[]
 serverlog=None
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+## @file GridPos.py
+# @package GridPos
+# @brief Positions of the cycles
+# @details This file keeps the latest PLAYER_GRIDPOS of every cycle. The ladderlog event is only
+#          enabled while someone is subscribed.
+
+import logging
+import threading
+import time
+from array import array
+import Armagetronad
+import LadderLogHandlers
+
+__save_vars=["log", "table", "index", "free_slots", "subscribers", "interval", "updated"]
+
+## @brief The logging object
+# @private
+# @details Used for logging by this module
+log=logging.getLogger("GridPosModule")
+log.addHandler(logging.NullHandler() )
+
+## @brief Number of values stored per cycle: x, y, xdir, ydir and the time of the update.
+# @private
+STRIDE=5
+
+# The state below is kept if this module is executed again by tools.reload_module, so
+# subscribers keep getting positions.
+
+## @brief The positions
+# @details Flat array of STRIDE values per cycle. Use index to find the slot of a player.
+# @private
+table=globals().get("table", array("d"))
+
+## @brief Slots of the players
+# @details Dictionary of the slot numbers in table, where the ladder name of the player is the key.
+# @private
+index=globals().get("index", dict())
+
+## @brief Unused slots in table
+# @private
+free_slots=globals().get("free_slots", [])
+
+## @brief Number of subscribers
+# @private
+subscribers=globals().get("subscribers", 0)
+
+## @brief Interval to use for GRID_POSITION_INTERVAL while someone is subscribed.
+interval=globals().get("interval", 0)
+
+## @brief Protects the table and notifies waiting readers about updates.
+# @private
+updated=globals().get("updated") or threading.Condition()
+
+## @brief Handles PLAYER_GRIDPOS
+# @details Stores the position of the cycle.
+# @private
+def HandleGridPos(lname, x, y, xdir, ydir, *args):
+    with updated:
+        slot=index.get(lname)
+        if slot==None:
+            if free_slots:
+                slot=free_slots.pop()
+            else:
+                slot=len(table)//STRIDE
+                table.extend((0,)*STRIDE)
+            index[lname]=slot
+        i=slot*STRIDE
+        table[i:i+STRIDE]=array("d", (float(x), float(y), float(xdir), float(ydir), time.monotonic()))
+        updated.notify_all()
+
+## @brief Subscribes to position updates.
+# @details The first subscriber enables the PLAYER_GRIDPOS ladderlog event.
+#          Call Unsubscribe() if positions aren't needed anymore.
+def Subscribe():
+    global subscribers
+    with updated:
+        subscribers+=1
+        if subscribers!=1:
+            return
+    Armagetronad.SendCommand("GRID_POSITION_INTERVAL "+str(interval))
+    LadderLogHandlers.register_handler("PLAYER_GRIDPOS", HandleGridPos) # Enables the ladderlog event.
+
+## @brief Ends a subscription.
+# @details The last subscriber disables the PLAYER_GRIDPOS ladderlog event.
+def Unsubscribe():
+    global subscribers
+    with updated:
+        if subscribers==0:
+            return
+        subscribers-=1
+        if subscribers!=0:
+            return
+    LadderLogHandlers.unregister_handler("PLAYER_GRIDPOS", HandleGridPos) # Disables the ladderlog event.
+
+## @brief Reads the position of a player.
+# @private
+# @note Must be called with updated held.
+def __read(lname, max_age):
+    slot=index.get(lname)
+    if slot==None:
+        return None
+    i=slot*STRIDE
+    if max_age!=None and time.monotonic()-table[i+4] > max_age:
+        return None
+    return tuple(round(v, 2) for v in table[i:i+4])
+
+## @brief Gets the position of a player's cycle.
+# @details Returns the stored position. If there is no position that is new enough and
+#          timeout is given, subscribes and waits for the next update.
+# @param lname The ladder name of the player.
+# @param max_age Maximal age of the position in seconds. None to accept any age.
+# @param timeout Seconds to wait for an update. None or 0 to return immediately.
+# @return A tuple x, y, xdir, ydir or None if no position is available.
+def Get(lname, max_age=None, timeout=None):
+    with updated:
+        pos=__read(lname, max_age)
+    if pos!=None or not timeout:
+        return pos
+    Subscribe()
+    try:
+        with updated:
+            updated.wait_for(lambda: __read(lname, max_age), timeout)
+            return __read(lname, max_age)
+    finally:
+        Unsubscribe()
+
+## @brief Gets the positions of all cycles.
+# @param max_age Maximal age of the positions in seconds. None to accept any age.
+# @return Dictionary of tuples x, y, xdir, ydir, where the ladder name of the player is the key.
+def GetAll(max_age=None):
+    ret=dict()
+    with updated:
+        for lname in index:
+            pos=__read(lname, max_age)
+            if pos!=None:
+                ret[lname]=pos
+    return ret
+
+## @brief Forgets the position of a player.
+# @param lname The ladder name of the player.
+def Forget(lname):
+    with updated:
+        slot=index.pop(lname, None)
+        if slot!=None:
+            free_slots.append(slot)
+
+# Replaces the handler of the old code if this module was executed again while someone is
+# subscribed. Otherwise tools.reload_module would remove it.
+if subscribers:
+    LadderLogHandlers.register_handler("PLAYER_GRIDPOS", HandleGridPos)
+
+##################### TESTS ###################################################
+import unittest
+
+## @brief Test the GridPos module
+class GridPosModuleTest(unittest.TestCase):
+    def tearDown(self):
+        import GridPos
+        while GridPos.subscribers:
+            GridPos.Unsubscribe()
+        GridPos.Forget("test_player")
+
+    def test_reload_keeps_state(self):
+        import GridPos
+        import tools
+        GridPos.Subscribe()
+        GridPos.HandleGridPos("test_player", 1, 2, 0, 1)
+        self.assertTrue(tools.reload_module("GridPos"), "Reloading failed")
+        self.assertEqual(GridPos.subscribers, 1, "Subscribers were lost")
+        self.assertEqual(GridPos.Get("test_player"), (1, 2, 0, 1), "Positions were lost")
+        handlers=LadderLogHandlers.dispatchTable.get("PLAYER_GRIDPOS", ())
+        self.assertIn(GridPos.HandleGridPos, handlers, "The handler of the new code isn't registered")
+        self.assertEqual(len([i for i in handlers if i.__module__=="GridPos"]), 1, "The old handler is still registered")
+
+## @brief Get a test suite
+def suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(GridPosModuleTest)
+
+if __name__=="__main__":
+    unittest.TextTestRunner(verbosity=2).run(suite() )
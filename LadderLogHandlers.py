@@ -9,14 +9,18 @@ import AccessLevel
 import Messages
 import Player
 import logging
+import threading
 import Team
 import Poll
 import Global
-from threading import Thread
-import threading
 import tools
+import inspect
+import Scheduler
+import Settings
+import GridPos
+import CommandQueue
 
-__save_vars=["log", "runningCommands"]
+__save_vars=["log"]
 ## @brief The logging object
 # @private
 # @details Used for logging by this module
@@ -30,8 +34,33 @@ log.addHandler(logging.NullHandler() )
 atRoundend=[]
 atMatchend=[]
 
+## @brief Handlers registered with register_handler
+# @details Dictionary of lists of handlers, where the ladderlog event in uppercase is the key.
+# @note The dictionary and the lists are never changed, they're replaced by changed copies.
+#       So they can be read from every thread without locking.
 extraHandlers=dict()
 
+## @brief Serializes changes of extraHandlers and dispatchTable
+# @private
+handlersLock=threading.RLock()
+
+## @brief Handlers of each package
+# @details Dictionary of sets of (event, handler) tuples, where the lowercase package name
+#          (see tools.get_package) is the key. Used by unregister_package.
+# @private
+packageHandlers=dict()
+
+## @brief Handlers for every ladderlog event
+# @details Dictionary of tuples of all handlers of an event, where the ladderlog event in
+#          uppercase is the key. Events nobody handles aren't in the dictionary.
+# @note Rebuilt by rebuildDispatchTable(). Don't change it directly.
+dispatchTable=dict()
+
+## @brief Handlers defined in this module
+# @details Dictionary of the functions of this module that handle ladderlog events, where
+#          the ladderlog event in uppercase is the key.
+builtinHandlers=dict()
+
 ## @brief Is the round started?
 # @details True if yes, False otherwise.
 roundStarted=False
@@ -40,42 +69,126 @@ roundStarted=False
 # @details Current round number starting with 1 for the first round. This number is reseted every time a new match starts.
 round=1
 
-runningCommands=[]
 ## @brief Adds a handler for a ladderlog event.
 # @details Adds a custom functions as a handler for a ladderlog event.
 # @param event The name of the ladderlog event, in uppercase. Example: INVALID_COMMAND
 # @param *functions Function(s) to add as a handler.
+# @note A handler with the same name and module as one that is already registered replaces
+#       it, so a reloaded module can register its handlers again.
 def register_handler(event, *functions):
-    if event in extraHandlers:
-        funcnames=dict()
-        for func in extraHandlers[event]:
-            funcnames[func.__name__]=func.__module__
+    global extraHandlers
+    with handlersLock:
+        handlers=dict(extraHandlers)
+        if event in handlers and len(handlers[event]):
+            funcs=list(handlers[event])
+            positions=dict(((func.__name__, func.__module__), i) for i, func in enumerate(funcs))
+            added=[]
+            for func in functions:
+                key=(func.__name__, func.__module__)
+                if key in positions:
+                    old=funcs[positions[key]]
+                    if old is func:
+                        continue
+                    packageHandlers.get(tools.get_package(old.__module__).lower(), set()).discard((event, old))
+                    funcs[positions[key]]=func
+                else:
+                    positions[key]=len(funcs)
+                    funcs.append(func)
+                added.append(func)
+            handlers[event]=funcs
+            functions=added
+        else:
+            Armagetronad.SendCommand("LADDERLOG_WRITE_"+event+" 1")
+            handlers[event]=list(functions)
         for func in functions:
-            if func.__name__ not in funcnames or func.__module__ != funcnames[func.__name__]:
-                extraHandlers[event]+=[func]
-    else:
-        Armagetronad.SendCommand("LADDERLOG_WRITE_"+event+" 1")
-        extraHandlers[event]=list(functions)
+            packageHandlers.setdefault(tools.get_package(func.__module__).lower(), set()).add((event, func))
+        extraHandlers=handlers
+        rebuildDispatchTable()
         
 def unregister_handler(event, *functions):
     global extraHandlers
-    if event in extraHandlers:
+    with handlersLock:
+        if event not in extraHandlers:
+            return
+        handlers=dict(extraHandlers)
+        handlers[event]=[func for func in handlers[event] if func not in functions]
         for func in functions:
-            del extraHandlers[event][extraHandlers.index(func)]
-        if len(extraHandlers[event])==0:
+            packageHandlers.get(tools.get_package(func.__module__).lower(), set()).discard((event, func))
+        if len(handlers[event])==0 and event not in builtinHandlers:
             Armagetronad.SendCommand("LADDERLOG_WRITE_"+event+" 0")
-    else:
-        return
+        extraHandlers=handlers
+        rebuildDispatchTable()
     
-def unregister_package(name):
+## @brief Removes handlers registered with register_handler.
+# @details Only the lists of the events of the handlers are copied.
+# @private
+# @param registered Set of (event, handler) tuples.
+def removeHandlers(registered):
     global extraHandlers
-    for event in extraHandlers:
-        needRemove=[]
-        for func in extraHandlers[event]:
-            if tools.get_package(func.__module__).lower()==name.lower():
-                    needRemove+=[func]
-        for func in needRemove:
-            extraHandlers[event].remove(func)
+    with handlersLock:
+        if not registered:
+            return
+        remove=dict()
+        for event, func in registered:
+            remove.setdefault(event, set()).add(func)
+        handlers=dict(extraHandlers)
+        for event, funcs in remove.items():
+            handlers[event]=[func for func in handlers.get(event, ()) if func not in funcs]
+        extraHandlers=handlers
+        rebuildDispatchTable()
+
+## @brief Removes all handlers of a package.
+# @details Takes time proportional to the number of handlers the package registered.
+# @param name The name of the package.
+def unregister_package(name):
+    with handlersLock:
+        removeHandlers(packageHandlers.pop(name.lower(), set()))
+
+## @brief Gets the handlers of a module.
+# @param name The full name of the module.
+# @return Set of (event, handler) tuples.
+def getModuleHandlers(name):
+    with handlersLock:
+        return set(i for i in packageHandlers.get(tools.get_package(name).lower(), ()) if i[1].__module__==name)
+
+## @brief Removes handlers.
+# @details Handlers that were replaced meanwhile aren't registered anymore and are ignored.
+# @param registered Set of (event, handler) tuples, like getModuleHandlers() returns.
+def unregister_handlers(registered):
+    with handlersLock:
+        for event, func in registered:
+            packageHandlers.get(tools.get_package(func.__module__).lower(), set()).discard((event, func))
+        removeHandlers(registered)
+
+## @brief Removes all handlers of a module.
+# @details Unlike unregister_package, only the handlers defined in exactly this module are
+#          removed.
+# @param name The full name of the module.
+def unregister_module(name):
+    unregister_handlers(getModuleHandlers(name))
+
+## @brief Gets the ladderlog event for the name of a handler.
+# @details Converts the CamelCase name of a handler to the ladderlog event name.
+#          Example: PlayerEntered -> PLAYER_ENTERED
+# @param name The name of the handler.
+# @return The ladderlog event in uppercase.
+def getEventName(name):
+    return "".join([i.upper() if i.islower() else "_"+i for i in name])[1:]
+
+## @brief Rebuilds the dispatch table.
+# @details Must be called every time extraHandlers changes.
+#          register_handler, unregister_handler, unregister_package and unregister_module do that.
+def rebuildDispatchTable():
+    global dispatchTable
+    with handlersLock:
+        table=dict()
+        for event, func in builtinHandlers.items():
+            table[event]=(func,)
+        for event, funcs in extraHandlers.items():
+            if len(funcs):
+                table[event]=table.get(event, ())+tuple(funcs)
+        dispatchTable=table
+
 ## @brief Handles commands
 # @details Every time when a command that isn't handled by the server is entered, this
 #          function will be called.
@@ -84,6 +197,7 @@ def unregister_package(name):
 # @param ip The ip of the player who tried to execute the command
 # @param access The numeric access level of the player who tried to execute the command
 def InvalidCommand(command, player, ip, access, *args):
+    access=int(access)
     # Check if the command is valid ####
     if not player in Player.players:
         log.error("Player „"+player+"“ doesn't exist.")
@@ -98,13 +212,14 @@ def InvalidCommand(command, player, ip, access, *args):
         Armagetronad.PrintPlayerMessage(player," ".join(args) )
         return
     saved_command=command
-    command=[realcommand for realcommand in Commands.getCommands() if realcommand.lower()==command]
-    if len(command)>1:
-        log.warning("More than one function for command "+command[0]+". Chosing 1st one.")
-    elif len(command)<1:
-        Armagetronad.PrintPlayerMessage(player, Messages.CommandNotFound.format(command=saved_command) )
+    command=Commands.findCommand(command)
+    if command==None:
+        message=Messages.CommandNotFound.format(command=saved_command)
+        completions=Commands.completeCommand(saved_command, limit=5, access=access)
+        if len(completions):
+            message=message+" "+Messages.CommandCompletions.format(commands=", ".join("/"+i for i in completions) )
+        Armagetronad.PrintPlayerMessage(player, message)
         return
-    command=command[0]
     if command in Commands.disabled:
         Armagetronad.PrintPlayerMessage(player, Messages.DisabledCommand)
         return    
@@ -125,26 +240,11 @@ def InvalidCommand(command, player, ip, access, *args):
         return
 
     # Process command ####
-    def ProcessCommand(command, args):
-        global runningCommands
-        args=(access,player) + args
-        try:
-            #imp.reload(sys.modules[Commands.commands[command].__module__])
-            Commands.commands[command](*args)
-        except Exception as e:
-            raise e
-        try:
-            runningCommands.remove(threading.current_thread() )    
-        except:
-            log.debug("Command thread already removed. Command:"+command)
-            pass
     if command=="reload_script": # we need to do this here
         raise Global.ReloadException()
-    t=Thread(target=ProcessCommand, args=(command, args), name="HandleCommand"+command.capitalize() )
-    t.daemon=True
-    global runningCommands
-    runningCommands.append(t)
-    t.start()
+    if not CommandQueue.Submit(player, Commands.commands[command], access, player, *args):
+        log.warning("Dropped command /"+command+" of player "+player+": Too many commands waiting.")
+        Armagetronad.PrintPlayerMessage(player, Messages.TooManyCommands)
 
 ## @brief Handles player joined
 # @details Every time when a player joins the game this function is called.
@@ -193,9 +293,11 @@ def PlayerLeft(lname, ip):
         log.warning("„{0} left the game but the script doesn't know him. Ignoring.".format(lname) )
         return
     log.info("Player {0} left the server.".format(lname) )
-    if Poll.current_poll and len([i for i in Player.players if Player.players[i].ip==Player.players[lname]])==1:
-        Poll.current_poll.RemovePlayerVote(lname)
+    if Poll.polls and len(Player.by_ip.get(Player.players[lname].ip, ()))==1:
+        for poll in list(Poll.polls.values()):
+            poll.RemovePlayerVote(lname)
     Player.Remove(lname)
+    GridPos.Forget(lname)
 
 ## @brief Handle online player
 # @details For each online player this function is called.
@@ -210,7 +312,9 @@ def OnlinePlayer(lname, red, green, blue, ping, teamname=None):
         log.warning("Player „"+lname+"“ doesn't exist in OnlinePlayer. Ignoring.")
         return
     if teamname!=None:
-        allow_team_name_player=Armagetronad.GetSetting("ALLOW_TEAM_NAME_PLAYER")
+        allow_team_name_player=Settings.Get("ALLOW_TEAM_NAME_PLAYER", "")
+        if allow_team_name_player=="" and Settings.Watching():
+            Settings.Refresh("ALLOW_TEAM_NAME_PLAYER") # Known in the next round.
         if allow_team_name_player!="":
            if int(allow_team_name_player)!=0:
                 teamname=Player.players[lname].name
@@ -232,8 +336,10 @@ def RoundCommencing(round_num_current, round_num_max):
     global roundStarted
     roundStarted=True
     round=int(round_num_current)
+    Scheduler.CancelGroup("round")
     handlers=[]
     if round==1:
+        Scheduler.CancelGroup("match")
         handlers.extend(atMatchend)
         atMatchend=list()
     # Handle matchend actions
@@ -243,16 +349,7 @@ def RoundCommencing(round_num_current, round_num_max):
         except Exception as e:
             log.error("Could not execute handler "+str(func.__name__)+": "+str(e.__class__.__name__) )
     # Polls
-    if Poll.current_poll != None:
-        if Poll.current_poll.aliveRounds==0:
-            if not Poll.current_poll.CheckResult(only_sure=True):
-                Armagetronad.SendCommand("CENTER_MESSAGE "+Messages.PollTimedOut.format(target=Poll.current_poll.target))
-                Poll.current_poll=None
-        else:
-            if not Poll.current_poll.CheckResult(only_sure=True):
-                Armagetronad.PrintMessage(Messages.PollInProgress.format(target=Poll.current_poll.target, expire=Poll.current_poll.aliveRounds) )
-                Armagetronad.SendCommand("CENTER_MESSAGE "+Messages.PollInProgressCenter) 
-                Poll.current_poll.aliveRounds=Poll.current_poll.aliveRounds-1
+    Poll.RoundStarted()
 
 def WaitForExternalScript(*args):
     global atRoundend
@@ -309,6 +406,12 @@ def Positions(team, *members):
     except:
         Armagetronad.PrintMessage("Script bugged, but not fatal.")
 
+for name, func in list(globals().items()):
+    if name[0].isupper() and inspect.isfunction(func):
+        builtinHandlers[getEventName(name)]=func
+del name, func
+rebuildDispatchTable()
+
 ## @brief Enables logging
 # @details This function enables logging for this module.
 # @param h The handler used for logging
@@ -12,11 +12,20 @@ PlayerColorCode="0xddffdd"
 # @param command The command the player wanted to execute.
 CommandNotFound="Sorry, command /{command} doesn't exist. Maybe you can try /info."
 
+## @brief Command completions message
+# @details This message is appended to CommandNotFound if commands start with what the player typed.
+# @param commands The commands, separated by commas.
+CommandCompletions="Did you mean {commands}?"
+
 ## @brief Access denied message
 # @details This message is printed if the player isn't allowed to execute the command
 # @param command The command the player wanted to execute
 NotAllowed="You're not allowed to use the command /{command}. "
 
+## @brief Too many commands message
+# @details This message is printed if the player has too many commands waiting to be executed.
+TooManyCommands="0xff4400Slow down! Your previous commands are still being executed."
+
 ## @brief Player not found message
 # @details This message is printed if the player doesn't exist in player list (bug)..
 PlayerNotExist="Sorry, the script has a bug. You don't exist in the script's player list. \n"\
@@ -44,7 +53,15 @@ ModeNotExist="Mode {mode} doesn't exist! Look at /info modes for a list of all a
 # @details This message is printed when a vote is active.
 # @param target The target of the active vote
 # @param expire How much rounds does this vote still stay alive?
-PollInProgress="0xff8844Poll for 0xffff00{target} 0xff8844in progress. Use /yes or /no to vote! This vote expires in {expire} rounds"
+# @param id The id of the vote
+PollInProgress="0xff8844Poll {id} for 0xffff00{target} 0xff8844in progress. Use /yes {id} or /no {id} to vote! This vote expires in {expire} rounds"
+
+## @brief Vote is in progress message for votes that time out
+# @details This message is printed when a vote which expires after some time is active.
+# @param target The target of the active vote
+# @param expire How much seconds does this vote still stay alive?
+# @param id The id of the vote
+PollInProgressTime="0xff8844Poll {id} for 0xffff00{target} 0xff8844in progress. Use /yes {id} or /no {id} to vote! This vote expires in {expire} seconds"
 
 PollInProgressCenter="0xff8800Poll in progress! Vote!"
 
@@ -52,7 +69,8 @@ PollInProgressCenter="0xff8800Poll in progress! Vote!"
 # @details This message is displayed when a new vote was added.
 # @param target The target of the vote which was added
 # @param player The player who added the vote.
-PollAdded="0x00ff00Poll for 0xffff00{target} 0x00ff00submitted by 0x00ff88{player}. Type /yes or /no to vote!"
+# @param id The id of the vote
+PollAdded="0x00ff00Poll {id} for 0xffff00{target} 0x00ff00submitted by 0x00ff88{player}. Type /yes {id} or /no {id} to vote!"
 
 ## @brief Vote cancelled message
 # @details This message is printed when an admin cancelled a vote.
@@ -91,6 +109,12 @@ PlayerAlreadyVoted="0xff0033You have already voted!"
 #          there isn't any active vote at the time.
 NoActivePoll="There's no poll in progress!"
 
+## @brief Poll doesn't exist message.
+# @details This message is printed when a player tries to use the /yes or /no commands with
+#          the id of a poll that isn't active.
+# @param id The given id
+PollNotExist="0xff0033There's no poll {id} in progress!"
+
 ## @brief Access level changed message.
 # @details This message is printed when /acl was successfully called.
 # @param command The command of which the access level has changed.
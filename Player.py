@@ -5,16 +5,127 @@
 # @details This file contains functions and classes that used for player management.
 
 import logging
+import threading
 import Team
 import Armagetronad
 
-__save_vars= ["players","log"]
+__save_vars= ["players","log","listeners"]
 
 ## @brief This variable is used to store the players.
 # @details This variable is a dictionary of players where the ladder name of the player
 #          is the key.
+# @note The dictionary is never changed, it's replaced by a changed copy. So it can be
+#       read and iterated from every thread without locking. Use Add(), Remove() and
+#       UpdatePlayer() to change it.
 players=dict()
 
+## @brief Serializes changes of the player list and the indexes
+# @details Only needed for changing them. Readers don't need it.
+lock=threading.RLock()
+
+## @brief Players by ip
+# @details Dictionary of frozensets of the ladder names of the players, where the ip is the key.
+# @note Kept up to date by the Player class. Don't change it. Like players, the dictionary
+#       is replaced by a changed copy, so it can be iterated from every thread.
+by_ip=dict()
+
+## @brief Players by team
+# @details Dictionary of frozensets of the ladder names of the players, where the escaped team
+#          name is the key. Spectators have the key None.
+# @note Kept up to date by the Player class. Don't change it. Like players, the dictionary
+#       is replaced by a changed copy, so it can be iterated from every thread.
+by_team=dict()
+
+## @brief Ladder names of the bots
+# @details frozenset, replaced when it changes.
+# @note Kept up to date by the Player class. Don't change it.
+bots=frozenset()
+
+## @brief Ladder names of the players who are alive
+# @details Players who have lives left. frozenset, replaced when it changes.
+# @note Kept up to date by the Player class. Don't change it.
+alive=frozenset()
+
+## @brief Functions called when a player is indexed or unindexed
+# @details Dictionary of functions, where the name of the listener is the key. The functions
+#          are called with the ladder name, the Player and True when the player was added to
+#          the indexes or False when it's about to be removed. A change of the ip, team or
+#          is_human of a player removes and adds it again.
+# @note Kept if this module is executed again by tools.reload_module, because the modules
+#       that registered a listener aren't executed again.
+listeners=globals().get("listeners", dict())
+
+## @brief Adds a player to an index
+# @private
+# @return A changed copy of the index.
+def addToIndex(index, key, lname):
+    index=dict(index)
+    index[key]=index.get(key, frozenset())|{lname}
+    return index
+
+## @brief Removes a player from an index
+# @private
+# @return A changed copy of the index.
+def removeFromIndex(index, key, lname):
+    if key not in index:
+        return index
+    index=dict(index)
+    members=index[key]-{lname}
+    if members:
+        index[key]=members
+    else:
+        del index[key]
+    return index
+
+## @brief Adds a player to all indexes
+# @private
+def indexPlayer(lname, player, notify=True):
+    global by_ip
+    global by_team
+    global bots
+    global alive
+    with lock:
+        by_ip=addToIndex(by_ip, player.ip, lname)
+        by_team=addToIndex(by_team, player.getTeam(), lname)
+        if not player.is_human:
+            bots=bots|{lname}
+        if player.getLives()>0:
+            alive=alive|{lname}
+    if not notify:
+        return
+    for listener in list(listeners.values()):
+        listener(lname, player, True)
+
+## @brief Removes a player from all indexes
+# @private
+def unindexPlayer(lname, player):
+    global by_ip
+    global by_team
+    global bots
+    global alive
+    for listener in list(listeners.values()):
+        listener(lname, player, False)
+    with lock:
+        by_ip=removeFromIndex(by_ip, player.ip, lname)
+        by_team=removeFromIndex(by_team, player.getTeam(), lname)
+        bots=bots-{lname}
+        alive=alive-{lname}
+
+## @brief Rebuilds all indexes from \link Player.players\endlink
+# @note The listeners aren't called.
+def rebuildIndexes():
+    global by_ip
+    global by_team
+    global bots
+    global alive
+    with lock:
+        by_ip=dict()
+        by_team=dict()
+        bots=frozenset()
+        alive=frozenset()
+        for lname, player in players.items():
+            indexPlayer(lname, player, notify=False)
+
 ## @brief Adds a new Player
 # @details Use this function to add a new player.
 # @param lname The name used on the ladder for the player
@@ -24,19 +135,42 @@ players=dict()
 # @note The player is stored in \link Player.players\endlink
 # @note This triggers the event "Player added"
 def Add(lname,name,ip):
-    if lname in players:
-        raise RuntimeError("Player „"+lname+"“ already exists.")
-    players[lname]=Player(lname,name,ip)
+    global players
+    with lock:
+        if lname in players:
+            raise RuntimeError("Player „"+lname+"“ already exists.")
+        new_players=dict(players)
+        new_players[lname]=Player(lname,name,ip)
+        players=new_players
+    indexPlayer(lname, players[lname])
 
 ## @brief Gets a bots
 # @details Returns all players that has is_human set to false.
 # @return The list of bot names
 def getBots():
-    bots=[]
-    for k,p in players.items():
-        if p.is_human==False:
-            bots.append(k)
-    return bots
+    return list(bots)
+
+## @brief Gets the players with an ip
+# @param ip The ip
+# @return Set of the ladder names of the players who use the given ip.
+def getPlayersByIp(ip):
+    return set(by_ip.get(ip, ()))
+
+## @brief Gets the players in a team
+# @param teamname The escaped name of the team. None to get the spectators.
+# @return Set of the ladder names of the players in the given team.
+def getPlayersByTeam(teamname):
+    return set(by_team.get(teamname, ()))
+
+## @brief Gets the spectators
+# @return Set of the ladder names of the players who are spectating.
+def getSpectators():
+    return getPlayersByTeam(None)
+
+## @brief Gets the players who are alive
+# @return Set of the ladder names of the players who have lives left.
+def getAlive():
+    return set(alive)
 
 ## @brief Handles player rename event
 # @details This function updates the player list. It's called by player rename event.
@@ -44,25 +178,30 @@ def getBots():
 # @param newname The new ladder name of the player
 def UpdatePlayer(oldname,newname):
     global log
-    if oldname not in players:
-        log.error("Player „"+oldname+"“ should be renamed to „"+newname+"“ , but it doesn't exist. Adding it.")
-        Add(newname,newname,"127.0.0.1")
-        return
-    #team=players[oldname].getTeam() #### The team code is buggy. In case players
-    #if team != None:                #### rename only at roundend when ONLINE_PLAYER
-    #                                #### is written to ladderlog too we could just skip it
-    #                                #### and set the team to None (leave the current team.)
-    #    pos=Team.teams[team].getPlayerPosition(oldname)
-    #team=players[oldname].getTeam()
-    players[oldname].leaveTeam(True)
-    players[newname]=players[oldname]
-    #try:
-    #    players[newname].joinTeam(team,quiet=True) ### 
-    #    if team != None:
-    #        Team.teams[team].shufflePlayer(newname,pos)
-    #except:
-    #        pass
-    del players[oldname]
+    global players
+    with lock:
+        if oldname not in players:
+            log.error("Player „"+oldname+"“ should be renamed to „"+newname+"“ , but it doesn't exist. Adding it.")
+            Add(newname,newname,"127.0.0.1")
+            return
+        #team=players[oldname].getTeam() #### The team code is buggy. In case players
+        #if team != None:                #### rename only at roundend when ONLINE_PLAYER
+        #                                #### is written to ladderlog too we could just skip it
+        #                                #### and set the team to None (leave the current team.)
+        #    pos=Team.teams[team].getPlayerPosition(oldname)
+        #team=players[oldname].getTeam()
+        unindexPlayer(oldname, players[oldname])
+        players[oldname].leaveTeam(True)
+        new_players=dict(players)
+        new_players[newname]=new_players.pop(oldname)
+        #try:
+        #    players[newname].joinTeam(team,quiet=True) ### 
+        #    if team != None:
+        #        Team.teams[team].shufflePlayer(newname,pos)
+        #except:
+        #        pass
+        players=new_players
+        indexPlayer(newname, players[newname])
 
 ## @brief Removes a player
 # @details This function removes the given player from the \link Player.players\endlink list.
@@ -70,9 +209,14 @@ def UpdatePlayer(oldname,newname):
 # @exception RuntimeError Raised if the player doesn't exist.'
 # @note This triggers the event "Player removed"
 def Remove(name):
-    if name not in players:
-        raise RuntimeError("Trying to remove player „"+name+"“, but it doesn't exist.")
-    del players[name]
+    global players
+    with lock:
+        if name not in players:
+            raise RuntimeError("Trying to remove player „"+name+"“, but it doesn't exist.")
+        unindexPlayer(name, players[name])
+        new_players=dict(players)
+        del new_players[name]
+        players=new_players
 
 ## @cond
 #logging
@@ -96,9 +240,10 @@ class Player:
     # @brief The name of the player
     # @details The full name of the player as it's used in the game
 
-    ## @property ip
+    ## @property __ip
     # @brief The player's ip
     # @details The ip of the player. Used for votes.
+    # @private
 
     ## @property __lives
     # @brief Remaining lives
@@ -131,17 +276,18 @@ class Player:
     # @brief The color of the player
     # @details A tuple of the color of the player(r, g, b). Each value is between 0 and 15
 
-    ## @property is_human
+    ## @property __is_human
     # @brief Is the player human?
     # @details True is yes, otherwise False.
+    # @private
 
     ## @property data
     # @brief Store data assigned with the player
     # @details Used to store additional data assigned with the player.
 
     ## @cond
-    __slots__=("__ladder_name","__old_ladder_name","name","ip","__lives","__team",
-               "__logged_in","ping","__old_name","color","is_human","data")
+    __slots__=("__ladder_name","__old_ladder_name","name","__ip","__lives","__team",
+               "__logged_in","ping","__old_name","color","__is_human","data")
     ## @endcond
 
     ## @brief Init function
@@ -152,7 +298,7 @@ class Player:
     def __init__(self, ladder_name, name, ip):
         self.__ladder_name=ladder_name
         self.name=name
-        self.ip=ip
+        self.__ip=ip
         self.__lives=1
         self.__team=None
         self.__old_ladder_name=ladder_name
@@ -160,9 +306,70 @@ class Player:
         self.ping=0
         self.__old_name=self.name
         self.color=15,0,0
-        self.is_human=True
+        self.__is_human=True
         self.data=dict()
 
+    ## @brief Is the player in the player list?
+    # @details Only players in \link Player.players\endlink are indexed.
+    # @private
+    def __isIndexed(self):
+        return players.get(self.__ladder_name) is self
+
+    ## @brief The player's ip
+    # @details The ip of the player. Used for votes.
+    @property
+    def ip(self):
+        return self.__ip
+
+    @ip.setter
+    def ip(self, ip):
+        with lock:
+            indexed=self.__isIndexed()
+            if indexed:
+                unindexPlayer(self.__ladder_name, self)
+            self.__ip=ip
+            if indexed:
+                indexPlayer(self.__ladder_name, self)
+
+    ## @brief Is the player human?
+    # @details True is yes, otherwise False.
+    @property
+    def is_human(self):
+        return self.__is_human
+
+    @is_human.setter
+    def is_human(self, is_human):
+        with lock:
+            indexed=self.__isIndexed()
+            if indexed:
+                unindexPlayer(self.__ladder_name, self)
+            self.__is_human=is_human
+            if indexed:
+                indexPlayer(self.__ladder_name, self)
+
+    ## @brief Sets the team and updates the index.
+    # @private
+    def __setTeam(self, teamname):
+        with lock:
+            indexed=self.__isIndexed()
+            if indexed:
+                unindexPlayer(self.__ladder_name, self)
+            self.__team=teamname
+            if indexed:
+                indexPlayer(self.__ladder_name, self)
+
+    ## @brief Sets the lives and updates the index.
+    # @private
+    def __setLives(self, lives):
+        global alive
+        with lock:
+            if self.__isIndexed():
+                if lives>0:
+                    alive=alive|{self.__ladder_name}
+                else:
+                    alive=alive-{self.__ladder_name}
+            self.__lives=lives
+
     ## @brief Del function
     # @details Removes the player from his team
     def __del__(self):
@@ -186,10 +393,10 @@ class Player:
                     return
         self.leaveTeam()
         if teamname == None:
-            self.__team=None
+            self.__setTeam(None)
             return
         if teamname == "ai":
-            self.__team="ai"
+            self.__setTeam("ai")
             self.is_human=False
         else:
             self.is_human=True
@@ -203,7 +410,7 @@ class Player:
         if not quiet:
             log.info("Player „" + self.name + "“ joined team „" + Team.teams[teamname].getName()
                      + "“.")
-        self.__team=teamname
+        self.__setTeam(teamname)
         if len(Team.teams[teamname].getMembers() ) == 1:
             Team.teams[teamname].color=self.color
 
@@ -229,7 +436,7 @@ class Player:
             Team.Remove(self.__team)
         if not quiet:
             log.info("Player „"+self.name+"” left team „"+teamname+"“.")
-        self.__team=None
+        self.__setTeam(None)
 
     ## @brief Set player's lives
     # @details This sets the player's lives to the given number. A value less or equal
@@ -241,16 +448,17 @@ class Player:
     def setLives(self, lives):
         if lives < 0:
             lives=0
-        self.__lives=lives
+        self.__setLives(lives)
 
     ## @brief This decreases the player's lives counter by 1
     # @details Call this function when the player crashed.
     # @return Remaining lives. 0 is the player is death.
     def crashed(self):
-        self.__lives=self.__lives-1
-        if self.__lives<0:
+        lives=self.__lives-1
+        if lives<0:
             log.debug("A player is crashed but shouldn't have been alive. Setting lives to 0.")
-            self.__lives=0
+            lives=0
+        self.__setLives(lives)
         return self.__lives
 
     ## @brief Kills the player.
@@ -259,7 +467,7 @@ class Player:
     # @note This triggers the event "Player killed" and "Player died".
     def kill(self):
         Armagetronad.SendCommand("KILL "+self.__old_ladder_name)
-        self.__lives=0
+        self.__setLives(0)
         log.info("Player " + self.__old_ladder_name + " got killed by the script.")
 
     ## @brief Sets the ladder name
@@ -279,17 +487,25 @@ class Player:
     # @param force Force position changing(teleporting) ?
     # @note This sets Player's lives to 0 if they are less 0
     def respawn(self, x ,y, xdir, ydir, force):
-        if self.__lives < 0:
-            self.__lives=0
-        if force:
-            Armagetronad.SendCommand("KILL "+self.__ladder_name)
-        Armagetronad.SendCommand("RESPAWN_PLAYER "+str(self.__ladder_name) + " 0 "+str(x)+
-                    " "+str(y)+" "+str(xdir)+" "+str(ydir) )
+        Armagetronad.SendCommands(self.getRespawnCommands(x, y, xdir, ydir, force) )
         #if force
             #SendCommand("TELEPORT_PLAYER {0} {1} {2} {3} {4}".format(self.__old_ladder_name,
             #            y,x,xdir,ydir) )
         #    pass
 
+    ## @brief Gets the commands that respawn the player
+    # @details Like respawn(), but returns the commands instead of sending them.
+    # @return List of commands.
+    def getRespawnCommands(self, x, y, xdir, ydir, force):
+        if self.__lives < 0:
+            self.__setLives(0)
+        commands=[]
+        if force:
+            commands.append("KILL "+self.__ladder_name)
+        commands.append("RESPAWN_PLAYER "+str(self.__ladder_name) + " 0 "+str(x)+
+                    " "+str(y)+" "+str(xdir)+" "+str(ydir) )
+        return commands
+
     ## @brief Gets ladder name
     # @details This function gets the ladder name
     # @return The ladder name
@@ -357,13 +573,15 @@ class Player:
 
 def __reload__(players__old, **rest):
     global players
-    players=dict()
+    new_players=dict()
     for player in players__old.values():
-        players[player.getLadderName()]=Player(player.getLadderName(), player.name, player.ip)
+        new_players[player.getLadderName()]=Player(player.getLadderName(), player.name, player.ip)
         for x in filter(lambda x: not x.startswith("__") and x.endswith("__"),dir(player)):
-            setattr(players[player.getLadderName()], x, getattr(player, x))
+            setattr(new_players[player.getLadderName()], x, getattr(player, x))
+    players=new_players
     for x in rest:
         globals()[x.replace("__old", "")]=rest[x]
+    rebuildIndexes()
     
 
 ## @brief Enables Logging
@@ -421,6 +639,17 @@ class PlayerModuleTest(unittest.TestCase):
         testPlayer.crashed()
         self.assertEqual(testPlayer.getLives(), 0, "Crashing failed: Lives wasn't counted down")
 
+    def test_indexes(self):
+        Add("test_index_player","Test index player", "127.0.0.2")
+        self.assertIn("test_index_player", getPlayersByIp("127.0.0.2"), "Indexing failed: Player isn't in the ip index")
+        self.assertIn("test_index_player", getSpectators(), "Indexing failed: Player isn't in the team index")
+        players["test_index_player"].ip="127.0.0.3"
+        self.assertNotIn("test_index_player", getPlayersByIp("127.0.0.2"), "Indexing failed: Old ip wasn't removed from the index")
+        players["test_index_player"].kill()
+        self.assertNotIn("test_index_player", getAlive(), "Indexing failed: Killed player is still alive")
+        Remove("test_index_player")
+        self.assertNotIn("test_index_player", getPlayersByIp("127.0.0.3"), "Indexing failed: Removed player is still indexed")
+
     def tearDown(self):
         players=self.saved_players
 
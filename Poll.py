@@ -4,19 +4,32 @@
 # @details This file contains classes and functions needed for votes.
 
 import logging
+import time
+import threading
 import Armagetronad
+import Scheduler
 import Player
 import Messages
 
-__save_vars=["log", "current_poll"]
+__save_vars=["log", "current_poll", "polls"]
 ## @brief The logging object
 # @details The logging object used for log messages by this module.
 # @note To enable or disable logging for this module use \link Poll.enableLogging\endlink
 log=logging.getLogger("VoteModule")
 log.addHandler(logging.NullHandler() )
 
+## @brief The active polls
+# @details Dictionary of the active polls, where the id of the poll is the key.
+# @note The dictionary is never changed, it's replaced by a changed copy. So it can be
+#       read and iterated from every thread without locking.
+polls=dict()
+
+## @brief Serializes changes of the polls and the votes
+# @details Only needed for changing them. Readers don't need it.
+lock=threading.RLock()
+
 ## @brief The current poll
-# @details None or an instance of the current Poll.
+# @details None or the Poll which was added last and is still active.
 current_poll=None
 
 ## @brief Can spectators vote?
@@ -28,47 +41,147 @@ spec_allowed=False
 defaultStayAlive=3
 
 ## @brief Creates a Poll.
-# @details Creates a Poll with the given name and set it as current_poll.
-# @exception RuntimeError Raised if there is already a Poll. (current_poll not None)
+# @details Creates a Poll with the given name and adds it to the active polls.
+# @exception RuntimeError Raised if there is already a Poll of the same kind.
 # @param target_human The human readable target of the Poll (What is the Poll about? ). Used for displaying.
 # @param action Function that is executed when the Poll succeed.
-# @param force Cancel current Poll if a Poll is already active? 
-
-def Add(target_human, action,player, force=False):
+# @param force Cancel the active Poll of the same kind? 
+# @param kind Optional Only one Poll of a kind can be active. The target is used if not given.
+# @param rounds Optional Number of rounds after which the Poll expires. defaultStayAlive if neither
+#               rounds nor seconds are given.
+# @param seconds Optional Number of seconds after which the Poll expires.
+# @return The Poll.
+def Add(target_human, action,player, force=False, kind=None, rounds=None, seconds=None):
     global current_poll
+    global polls
     if player not in Player.players:
         raise RuntimeError("Player doesn't exist.")
     if Player.players[player].getTeam()==None and not spec_allowed:
         raise RuntimeError("Spectators are not allowed to vote",3)
-    if current_poll != None:
+    if kind==None:
+        kind=target_human
+    for poll in list(polls.values()):
+        if poll.kind!=kind:
+            continue
         if not force:
             raise RuntimeError("Already a vote active", 1)
         else:
-            Cancel()
-    current_poll=Poll(target_human, action)        
-    Armagetronad.PrintMessage(Messages.PollAdded.format(target=target_human, player=Player.players[player].name))
+            Cancel(poll)
+    if rounds==None and seconds==None:
+        rounds=defaultStayAlive
+    poll=Poll(target_human, action, kind, rounds)
+    with lock:
+        poll.id=1
+        while poll.id in polls:
+            poll.id+=1
+        new_polls=dict(polls)
+        new_polls[poll.id]=poll
+        polls=new_polls
+        current_poll=poll
+        if seconds!=None:
+            poll.expires=time.monotonic()+seconds
+            poll.job=Scheduler.Add(seconds, Expire, poll)
+    Armagetronad.PrintMessage(Messages.PollAdded.format(target=target_human, player=Player.players[player].name, id=poll.id))
     log.info("New Poll  "+target_human+" created.")
+    return poll
+
+## @brief Gets a Poll.
+# @param poll_id The id of the poll. If None, the current poll is returned.
+# @return The Poll or None if there's no such poll.
+def Get(poll_id=None):
+    if poll_id==None:
+        return current_poll
+    try:
+        return polls.get(int(poll_id))
+    except ValueError:
+        return None
 
-## @brief Cancels the current Poll.
-# @details Sets current_poll to None and prints a message.
-def Cancel():
+## @brief Removes a Poll from the active polls.
+# @details Called when the Poll succeeded, failed, timed out or was cancelled.
+# @param poll The Poll to remove.
+# @return True if the Poll was removed, False if it wasn't active.
+def Finish(poll):
     global current_poll
-    target=current_poll.target
-    current_poll=None
+    global polls
+    with lock:
+        if polls.get(poll.id) is not poll:
+            return False
+        new_polls=dict(polls)
+        del new_polls[poll.id]
+        polls=new_polls
+        if current_poll is poll:
+            current_poll=list(polls.values())[-1] if polls else None
+    if poll.job!=None:
+        poll.job.cancel()
+    return True
+
+## @brief Cancels a Poll.
+# @details Removes the Poll and prints a message.
+# @param poll The Poll to cancel. If None, all polls are cancelled.
+def Cancel(poll=None):
+    if poll==None:
+        for poll in list(polls.values()):
+            Cancel(poll)
+        return
+    if not Finish(poll):
+        return
     log.info("Poll cancelled.")
-    Armagetronad.PrintMessage(Messages.PollCancelled.format(target=target))
+    Armagetronad.PrintMessage(Messages.PollCancelled.format(target=poll.target))
 
+## @brief Expires a Poll which timed out.
+# @details Called by the Scheduler when the time of the Poll is over.
+# @private
+def Expire(poll):
+    if not poll.CheckResult(only_sure=True) and Finish(poll):
+        Armagetronad.SendCommand("CENTER_MESSAGE "+Messages.PollTimedOut.format(target=poll.target))
+
+## @brief Handles the start of a round
+# @details Expires polls which ran out of rounds and reminds the players of the others.
+#          Called by LadderLogHandlers.RoundCommencing.
+def RoundStarted():
+    for poll in list(polls.values()):
+        if poll.CheckResult(only_sure=True):
+            continue
+        if poll.aliveRounds==0:
+            if Finish(poll):
+                Armagetronad.SendCommand("CENTER_MESSAGE "+Messages.PollTimedOut.format(target=poll.target))
+            continue
+        if poll.aliveRounds!=None:
+            Armagetronad.PrintMessage(Messages.PollInProgress.format(target=poll.target, expire=poll.aliveRounds, id=poll.id) )
+            poll.aliveRounds=poll.aliveRounds-1
+        else:
+            expire=int(poll.expires-time.monotonic())
+            Armagetronad.PrintMessage(Messages.PollInProgressTime.format(target=poll.target, expire=expire, id=poll.id) )
+        Armagetronad.SendCommand("CENTER_MESSAGE "+Messages.PollInProgressCenter)
+
+## @brief Updates the counters of the active polls
+# @details Called by the Player module every time a player is added, removed or changes
+#          the team or ip.
+# @private
+def playerChanged(lname, player, added):
+    for poll in list(polls.values()):
+        poll.playerChanged(lname, player, added)
+
+if not hasattr(Player, "listeners"):
+    Player.listeners=dict() # Player imports this module before it defines listeners. It keeps this dictionary.
+Player.listeners["Poll"]=playerChanged
 
 ## @brief The vote class
 # @details This class is used to manage a Poll.
 class Poll:
     ## @property __players_voted_yes
     # @brief What players voted for the Poll?
-    # @details Set of the players who voted for the Poll.
+    # @details Set of the ips of the players who voted for the Poll.
 
     ## @property __players_voted_no
     # @brief What players voted against the Poll?
-    # @details Set of the players who voted against the Poll.
+    # @details Set of the ips of the players who voted against the Poll.
+
+    ## @property __voted_playing
+    # @brief Number of human players that are playing and whose ip voted.
+
+    ## @property __voted_spec
+    # @brief Number of human players that are spectating and whose ip voted.
 
     ## @property target
     # @brief The human readable target of the Poll.
@@ -80,19 +193,72 @@ class Poll:
 
     ## @property aliveRounds
     # @brief When does the Poll expire?
-    # @details Number of round for which the Poll stays "alive".
+    # @details Number of round for which the Poll stays "alive". None if the Poll
+    #          doesn't expire at the end of a round.
+
+    ## @property expires
+    # @brief When does the Poll time out?
+    # @details Value of time.monotonic() when the Poll times out. None if the Poll doesn't
+    #          time out.
+
+    ## @property job
+    # @brief The Scheduler.Job that expires the Poll
+    # @details None if the Poll doesn't time out. Cancelled by Finish().
+
+    ## @property id
+    # @brief The number of the Poll
+    # @details Used by the players to choose the Poll for which to vote. Set by Add().
+
+    ## @property kind
+    # @brief The kind of the Poll
+    # @details Only one Poll of a kind can be active.
 
     ## @brief Init function (Constructor)
     # @details Inits a new Poll.
     # @param target Human readable target of the Poll.
     # @param action Action. None if no function should be called.
-    def __init__(self, target, action=None):
-        global defaultStayAlive
+    # @param kind The kind of the Poll. The target is used if not given.
+    # @param rounds Number of rounds for which the Poll stays alive. None if it doesn't
+    #               expire at the end of a round.
+    def __init__(self, target, action=None, kind=None, rounds=defaultStayAlive):
         self.target=target
         self.action=action
-        self.aliveRounds=defaultStayAlive
-        self.__players_voted_no=[]
-        self.__players_voted_yes=[]
+        self.aliveRounds=rounds
+        self.expires=None
+        self.job=None
+        self.id=None
+        self.kind=kind if kind!=None else target
+        self.__players_voted_no=set()
+        self.__players_voted_yes=set()
+        self.__voted_playing=0
+        self.__voted_spec=0
+
+    ## @brief Has the ip voted?
+    def hasVoted(self, ip):
+        return ip in self.__players_voted_yes or ip in self.__players_voted_no
+
+    ## @brief Counts a player whose ip voted.
+    # @private
+    def __count(self, player, n):
+        if not player.is_human:
+            return
+        if player.getTeam()==None:
+            self.__voted_spec+=n
+        else:
+            self.__voted_playing+=n
+
+    ## @brief Counts the players with the given ip.
+    # @private
+    def __countIp(self, ip, n):
+        for lname in Player.getPlayersByIp(ip):
+            self.__count(Player.players[lname], n)
+
+    ## @brief Updates the counters when a player changed.
+    # @details See Player.listeners.
+    def playerChanged(self, lname, player, added):
+        with lock:
+            if self.hasVoted(player.ip):
+                self.__count(player, 1 if added else -1)
 
     ## @brief Checks the result of the Poll.
     # @details Checks if the vote successed or failed.
@@ -121,25 +287,17 @@ class Poll:
             min_needed=0
         yes_count=len(self.__players_voted_yes)
         no_count=len(self.__players_voted_no)
-        voted_players=self.__players_voted_yes + self.__players_voted_no
-        bots=Player.getBots()
-        cur_mode=None
-        for player in Player.players:
-            if player in bots or Player.players[player].ip in voted_players:
-                continue
-            if Player.players[player].getTeam()==None: # Player is spectating
-                cur_mode=not_voted_spec
-            else:
-                cur_mode=not_voted
+        humans=len(Player.players)-len(Player.bots)
+        spectators=len(Player.by_team.get(None, ()))
+        for cur_mode, count in ((not_voted, humans-spectators-self.__voted_playing),
+                                (not_voted_spec, spectators-self.__voted_spec)):
             if cur_mode == "yes":
-                yes_count=yes_count+1
+                yes_count=yes_count+count
             elif cur_mode == "no":
-                no_count=no_count+1
-            else:
-                pass
-        num_allowed=len(Player.players)-len(Player.getBots())
+                no_count=no_count+count
+        num_allowed=humans
         if not spec_allowed:
-            num_allowed=num_allowed-len([i for i in Player.players.values() if i.getTeam()==None])
+            num_allowed=num_allowed-spectators
         if yes_count+no_count==0 or num_allowed==0:
             percent_yes=0
             percent_no=0
@@ -153,16 +311,18 @@ class Poll:
             percent_yes=100
             percent_no=0
         if percent_yes >= min_needed:
+            if not Finish(self):
+                return True # Another thread decided the Poll.
             log.info("Poll for {0} successed.".format(self.target) )
             Armagetronad.SendCommand("CONSOLE_MESSAGE "+Messages.PollSuccessed.format(target=self.target) )
             self.action()
         elif percent_no>(100-min_needed):
+            if not Finish(self):
+                return True
             log.info("Poll for {0} failed.".format(self.target) )
             Armagetronad.SendCommand("CONSOLE_MESSAGE "+Messages.PollFailed.format(target=self.target) )
         else:
             return False
-        global current_poll
-        current_poll=None
         return True
 
     ## @brief Sets what a player voted.
@@ -176,21 +336,29 @@ class Poll:
     def SetPlayerVote(self, player, vote):
         if player not in Player.players:
             raise RuntimeError("Player doesn't exist", 2)
-        if Player.players[player].ip in (self.__players_voted_yes + self.__players_voted_no):
-            raise RuntimeError("Player already voted", 1)
-        if Player.players[player].getTeam()==None and not spec_allowed: #spec not allowed and player is spectator
-            raise RuntimeError("Player not allowed to vote", 3)
-        if vote:
-            self.__players_voted_yes.append(Player.players[player].ip)
-        else:
-            self.__players_voted_no.append(Player.players[player].ip)
+        ip=Player.players[player].ip
+        with lock:
+            if self.hasVoted(ip):
+                raise RuntimeError("Player already voted", 1)
+            if Player.players[player].getTeam()==None and not spec_allowed: #spec not allowed and player is spectator
+                raise RuntimeError("Player not allowed to vote", 3)
+            if vote:
+                self.__players_voted_yes.add(ip)
+            else:
+                self.__players_voted_no.add(ip)
+            self.__countIp(ip, 1)
     
+    ## @brief Removes the vote of a player.
+    # @details Removes the vote of the ip of the given player.
+    # @param player The ladder name of the player.
     def RemovePlayerVote(self, player):
-        player=Player.players[player].ip
-        try:
-            del self.__players_voted_no[self.__players_voted_no.index(player)]
-        except IndexError:
-            del self.__players_voted_yes[self.__players_voted_yes.index(player)]
+        ip=Player.players[player].ip
+        with lock:
+            if not self.hasVoted(ip):
+                return
+            self.__countIp(ip, -1)
+            self.__players_voted_no.discard(ip)
+            self.__players_voted_yes.discard(ip)
 
 
 ## @brief Enables logging
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+## @file Scheduler.py
+# @package Scheduler
+# @brief Delayed execution of functions
+# @details This file contains a scheduler that executes functions after a delay. All delayed
+#          functions are executed by a single thread, ordered by a heap.
+
+import logging
+import heapq
+import threading
+import time
+import sys
+
+__save_vars=["log", "__jobs", "__groups", "__cancelled", "__changed", "__thread"]
+
+## @brief The logging object
+# @private
+# @details Used for logging by this module
+# @note To enable or disable logging of this module use \link Scheduler.enableLogging\endlink
+log=logging.getLogger("SchedulerModule")
+log.addHandler(logging.NullHandler() )
+
+# The state below is kept if this module is executed again by tools.reload_module, so the
+# running scheduler thread and jobs added meanwhile aren't lost.
+
+## @brief Pending jobs
+# @details Heap of Job objects, ordered by the time when they are due.
+# @note The list is changed in place only, so the scheduler thread always sees the same list.
+# @private
+__jobs=globals().get("__jobs", [])
+
+## @brief Jobs by group
+# @details Dictionary of sets of pending jobs, where the group is the key.
+# @private
+__groups=globals().get("__groups", dict())
+
+## @brief Number of cancelled jobs that are still in the heap.
+# @private
+__cancelled=globals().get("__cancelled", 0)
+
+## @brief Protects the heap and wakes up the scheduler thread.
+# @private
+__changed=globals().get("__changed") or threading.Condition()
+
+## @brief The scheduler thread
+# @private
+__thread=globals().get("__thread")
+
+## @class Scheduler.Job
+# @brief A delayed function call
+# @details Returned by Add(). Use cancel() to prevent the function from being called.
+class Job:
+    ## @property due
+    # @brief When the job is due
+    # @details Value of time.monotonic() at which the function gets called.
+
+    ## @property func
+    # @brief The function which to call.
+
+    ## @property args
+    # @brief The arguments which to pass to the function.
+
+    ## @property group
+    # @brief The group of the job. None if the job doesn't belong to a group.
+
+    ## @property cancelled
+    # @brief True if the job was cancelled.
+
+    ## @property done
+    # @brief True if the function was called.
+
+    ## @cond
+    __slots__=("due","seq","func","args","group","cancelled","done")
+    ## @endcond
+    __seq=0
+
+    def __init__(self, due, func, args, group=None):
+        self.due=due
+        self.seq=Job.__seq
+        Job.__seq+=1
+        self.func=func
+        self.args=args
+        self.group=group
+        self.cancelled=False
+        self.done=False
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+    ## @brief Cancels the job.
+    # @return True if the job was pending, False if it was already executed or cancelled.
+    def cancel(self):
+        return Cancel(self)
+
+## @brief Cancels a job
+# @param job The Job to cancel.
+# @return True if the job was pending, False if it was already executed or cancelled.
+def Cancel(job):
+    with __changed:
+        return __cancel(job)
+
+## @brief Cancels a job
+# @private
+# @note Must be called with __changed held.
+def __cancel(job):
+    global __cancelled
+    if job.cancelled or job.done:
+        return False
+    job.cancelled=True
+    __cancelled+=1
+    __removeFromGroup(job)
+    # Rebuild the heap if it's mostly cancelled jobs, so they don't pile up.
+    if __cancelled > 64 and __cancelled*2 > len(__jobs):
+        __jobs[:]=[i for i in __jobs if not i.cancelled]
+        heapq.heapify(__jobs)
+        __cancelled=0
+    return True
+
+## @private
+def __removeFromGroup(job):
+    if job.group is None or job.group not in __groups:
+        return
+    __groups[job.group].discard(job)
+    if not __groups[job.group]:
+        del __groups[job.group]
+
+## @brief Calls a function after a delay.
+# @details Schedules the given function to be called after delay seconds by the scheduler
+#          thread.
+# @param delay Seconds to wait before calling the function.
+# @param func The function which to call.
+# @param *args Arguments passed to the function.
+# @param group Optional Name of a group of jobs that can be cancelled together with CancelGroup.
+# @return The Job. Use Job.cancel() to cancel it.
+def Add(delay, func, *args, group=None):
+    global __thread
+    job=Job(time.monotonic()+delay, func, args, group)
+    with __changed:
+        heapq.heappush(__jobs, job)
+        if group is not None:
+            if group not in __groups:
+                __groups[group]=set()
+            __groups[group].add(job)
+        if __thread is None:
+            __thread=threading.Thread(target=__run, name="Scheduler")
+            __thread.daemon=True
+            __thread.start()
+        elif __jobs[0] is job:
+            __changed.notify()
+    return job
+
+## @brief Cancels all jobs of a group.
+# @param group The group of which to cancel the jobs.
+# @return The number of cancelled jobs.
+def CancelGroup(group):
+    with __changed:
+        if group not in __groups:
+            return 0
+        jobs=list(__groups[group])
+        for job in jobs:
+            __cancel(job)
+    if jobs:
+        log.debug("Cancelled "+str(len(jobs))+" jobs of group "+str(group))
+    return len(jobs)
+
+## @brief Returns the number of pending jobs.
+# @param group Optional Only count the jobs of this group.
+def Pending(group=None):
+    with __changed:
+        if group is not None:
+            return len(__groups.get(group, ()))
+        return len(__jobs)-__cancelled
+
+## @brief Main loop of the scheduler thread.
+# @private
+def __run():
+    global __cancelled
+    while True:
+        due=[]
+        with __changed:
+            while not due:
+                while __jobs and __jobs[0].cancelled:
+                    heapq.heappop(__jobs)
+                    __cancelled-=1
+                if not __jobs:
+                    __changed.wait()
+                    continue
+                now=time.monotonic()
+                if __jobs[0].due > now:
+                    __changed.wait(__jobs[0].due-now)
+                    continue
+                while __jobs and __jobs[0].due <= now:
+                    job=heapq.heappop(__jobs)
+                    if job.cancelled:
+                        __cancelled-=1
+                        continue
+                    __removeFromGroup(job)
+                    job.done=True
+                    due.append(job)
+        for job in due:
+            try:
+                job.func(*job.args)
+            except Exception as e:
+                log.error("Could not execute delayed function "+str(getattr(job.func, "__name__", job.func))+": "+
+                          e.__class__.__name__+" "+str(e))
+        sys.stdout.flush()
+
+## @brief Keeps the jobs and the scheduler thread when the module is reloaded.
+# @details The running thread and its Condition are reused, so no second thread is started.
+def __reload__(**old):
+    for x in old:
+        globals()[x.replace("__old", "")]=old[x]
+    with __changed:
+        # Jobs added later must be ordered after the pending ones.
+        if __jobs:
+            Job._Job__seq=max(Job._Job__seq, max(job.seq for job in __jobs)+1)
+        __changed.notify()
+
+## @brief Enables logging
+# @details This function enables logging for this module.
+# @param h The handler used for logging
+# @param f The formatter used for logging
+# @param level The logging level
+def enableLogging(level=logging.DEBUG, h=None,f=None):
+    global log
+    log.setLevel(level)
+    if not h:
+        h=logging.StreamHandler()
+        h.setLevel(level)
+    if not f:
+        f=logging.Formatter("[%(name)s] (%(asctime)s) %(levelname)s: %(message)s")
+    h.setFormatter(f)
+    for handler in log.handlers:
+        if type(handler)==type(h):
+            log.removeHandler(handler)
+    log.addHandler(h)
+
+##################### TESTS ###################################################
+import unittest
+
+## @brief Test the scheduler module
+class SchedulerModuleTest(unittest.TestCase):
+    def test_order(self):
+        done=[]
+        event=threading.Event()
+        Add(0.03, done.append, 3)
+        Add(0.01, done.append, 1)
+        Add(0.02, done.append, 2)
+        Add(0.04, event.set)
+        event.wait(1)
+        self.assertEqual(done, [1,2,3], "Jobs weren't executed in order")
+
+    def test_cancel(self):
+        done=[]
+        event=threading.Event()
+        job=Add(0.01, done.append, 1)
+        self.assertTrue(job.cancel(), "Cancelling a pending job failed")
+        self.assertFalse(job.cancel(), "Cancelling a job twice succeeded")
+        Add(0.02, event.set)
+        event.wait(1)
+        self.assertEqual(done, [], "Cancelled job got executed")
+
+    def test_cancel_group(self):
+        done=[]
+        event=threading.Event()
+        for i in range(5):
+            Add(0.01, done.append, i, group="test_round")
+        Add(0.01, done.append, "other")
+        self.assertEqual(Pending("test_round"), 5)
+        self.assertEqual(CancelGroup("test_round"), 5, "Not all jobs of the group were cancelled")
+        self.assertEqual(Pending("test_round"), 0)
+        Add(0.02, event.set)
+        event.wait(1)
+        self.assertEqual(done, ["other"], "Jobs of a cancelled group got executed")
+
+## @brief Get a test suite
+def suite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(SchedulerModuleTest)
+
+if __name__=="__main__":
+    unittest.TextTestRunner(verbosity=2).run(suite() )
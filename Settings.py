@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+## @file Settings.py
+# @package Settings
+# @brief Mirror of the server settings
+# @details This file keeps the values of the server settings in memory. Values are recorded
+#          when the script sends them and when the server writes to the server log that a
+#          setting changed, so reading a setting doesn't need to ask the server.
+
+import logging
+import re
+import threading
+import time
+import sys
+import Armagetronad
+from watch import WatchFile
+
+__save_vars=["log", "mirror"]
+
+## @brief The logging object
+# @private
+# @details Used for logging by this module
+log=logging.getLogger("SettingsModule")
+log.addHandler(logging.NullHandler() )
+
+## @brief Matches the server log lines about settings
+# @details Matches "SETTING changed from X to Y." and "SETTING is currently set to X."
+# @private
+pattern=re.compile(r"^(?:\[[^\]]*\] )?(?P<setting>[A-Z0-9_]+) (?:changed from (?P<old>.*) to (?P<new>.*)|is currently set to (?P<current>.*))\.$")
+
+## @brief Seconds after which an unanswered query is sent again.
+query_timeout=5
+
+## @class Settings.Mirror
+# @brief The known values of the server settings
+class Mirror:
+    ## @property values
+    # @brief Known values
+    # @details Dictionary of the values of the settings, where the setting in uppercase is the key.
+
+    ## @property pending
+    # @brief Pending refreshes
+    # @details Dictionary of (threading.Event, time) tuples, where the setting is the key.
+    #          The event is set when the value arrives, time is when the query was sent.
+
+    ## @property watcher
+    # @brief The thread that reads the server log. None if the server log isn't read.
+
+    def __init__(self):
+        self.values=dict()
+        self.pending=dict()
+        self.lock=threading.Lock()
+        self.watcher=None
+
+    ## @brief Records the value of a setting.
+    def set(self, setting, value):
+        with self.lock:
+            self.values[setting]=value
+            event=self.pending.pop(setting, (None, 0))[0]
+        if event:
+            event.set()
+
+    ## @brief Asks the server for the value of a setting.
+    # @details The query isn't sent again while the last one is pending, unless the server
+    #          didn't answer within query_timeout.
+    # @return threading.Event which is set when the value arrives.
+    def refresh(self, setting):
+        with self.lock:
+            event, sent=self.pending.get(setting, (None, 0))
+            if event!=None and time.monotonic()-sent<query_timeout:
+                return event
+            if event==None:
+                event=threading.Event()
+            self.pending[setting]=event, time.monotonic()
+        Armagetronad.SendCommand(setting)
+        sys.stdout.flush()
+        return event
+
+    ## @brief Handles a line of the server log.
+    def handleLine(self, line):
+        match=pattern.match(line.strip())
+        if match==None:
+            return
+        setting=match.group("setting")
+        if match.group("current")!=None:
+            self.set(setting, match.group("current").strip())
+        elif match.group("new").strip()=="" and setting in self.pending:
+            # Sending only the name of a setting clears it on some servers. Restore it.
+            value=match.group("old").strip()
+            Armagetronad.SendCommand(setting+" "+value)
+            self.set(setting, value)
+        else:
+            self.set(setting, match.group("new").strip())
+
+    ## @brief Reads the server log forever.
+    # @private
+    def watch(self, f):
+        while True:
+            try:
+                self.handleLine(f.readline())
+            except Exception as e:
+                log.error("Could not handle server log line: "+e.__class__.__name__+" "+str(e))
+
+    ## @brief Starts reading the server log.
+    # @details Only the lines written after this call are read.
+    # @param path The path of the server log.
+    def start(self, path):
+        if self.watcher!=None and self.watcher.is_alive():
+            return
+        f=WatchFile(open(path, encoding="latin-1"))
+        f.skipUnreadLines()
+        self.watcher=threading.Thread(target=self.watch, args=(f,), name="SettingsWatcher")
+        self.watcher.daemon=True
+        self.watcher.start()
+
+## @brief The settings mirror used by this module.
+mirror=Mirror()
+
+## @brief Starts to mirror the settings written to the server log.
+# @param path The path of the server log.
+def WatchServerlog(path):
+    mirror.start(path)
+
+## @brief Records a value sent to the server.
+# @details Called by Armagetronad.SendCommand for every setting the script sends.
+# @param setting The name of the setting in uppercase.
+# @param value The value.
+def Record(setting, value):
+    mirror.set(setting, value.strip())
+
+## @brief Gets the value of a setting without blocking.
+# @param setting The name of the setting.
+# @param default Returned if the value isn't known.
+# @return The value, or default if it isn't known yet.
+def Get(setting, default=None):
+    return mirror.values.get(setting.upper(), default)
+
+## @brief Is the value of the setting known?
+def Known(setting):
+    return setting.upper() in mirror.values
+
+## @brief Asks the server for the value of a setting.
+# @details Doesn't block. The value can be read with Get() as soon as the server answered.
+# @param setting The name of the setting.
+# @return threading.Event which is set when the value arrives.
+# @note The server log must be watched (see WatchServerlog), otherwise the answer is never read.
+def Refresh(setting):
+    return mirror.refresh(setting.upper())
+
+## @brief Is the server log watched?
+def Watching():
+    return mirror.watcher!=None and mirror.watcher.is_alive()
@@ -5,10 +5,12 @@
 # @details This file contains functions and class for team management
 
 import logging
+import threading
 import Armagetronad
 import Player
-import math
-__save_vars=["log", "teams", "max_teams", "max_team_members"]
+import Formation
+import heapq
+__save_vars=["log", "teams", "max_teams", "max_team_members", "free_ids", "next_id"]
 ## @brief The logging object
 # @private
 # @details Used for logging by this module
@@ -19,8 +21,14 @@ log.addHandler(logging.NullHandler() )
 ## @brief All teams
 # @details Dictionary of team added with Add(), where the escaped team name
 #          is the key.
+# @note The dictionary is never changed, it's replaced by a changed copy. So it can be
+#       read and iterated from every thread without locking.
 teams=dict()
 
+## @brief Serializes changes of teams
+# @details Only needed for changing it. Readers don't need it.
+lock=threading.RLock()
+
 
 ## @brief Adds a team
 # @details Creates a new team and saves it in the teams list
@@ -28,8 +36,14 @@ teams=dict()
 # @param members Optional members to add to the team.
 # @return Escaped name of the added team.
 def Add(name, *members):
+    global teams
     t=Team(name,members)
-    teams[t.getEscapedName()]=t
+    with lock:
+        if t.getEscapedName() in teams:
+            releaseId(teams[t.getEscapedName()].getId())
+        new_teams=dict(teams)
+        new_teams[t.getEscapedName()]=t
+        teams=new_teams
     return t.getEscapedName()
 
 ## @brief Removes a team
@@ -37,9 +51,46 @@ def Add(name, *members):
 # @param name The escaped name of the team to remove.
 # @exception RuntimeError Raised if the team doesn't exist.
 def Remove(name):
-    if name not in teams:
-        raise RuntimeError("Team {0} doesn't exist.".format(name) )
-    del teams[name]
+    global teams
+    with lock:
+        if name not in teams:
+            raise RuntimeError("Team {0} doesn't exist.".format(name) )
+        new_teams=dict(teams)
+        releaseId(new_teams.pop(name).getId())
+        teams=new_teams
+
+## @brief Ids that were used and are free again
+# @details Heap of ids, so the smallest free id is used first.
+# @private
+free_ids=[]
+
+## @brief The smallest id that was never used.
+# @private
+next_id=0
+
+## @brief Gets an unused team id
+# @details Returns the smallest id that is not used by any team.
+# @exception AssertionError Raised if all ids below max_teams are used.
+# @private
+def allocateId():
+    global next_id
+    with lock:
+        if free_ids:
+            return heapq.heappop(free_ids)
+        if next_id>=max_teams and max_teams>0:
+            log.error("Bug. Could not find any free id, but teams limit isn't reached.")
+            raise AssertionError("Could not find any free id.")
+        next_id+=1
+        return next_id-1
+
+## @brief Marks a team id as unused.
+# @private
+def releaseId(id):
+    with lock:
+        if id>=next_id:
+            return
+        heapq.heappush(free_ids, id)
+    log.debug("Released team id " + str(id))
 
 ##
 ## @brief The maximal teams
@@ -59,6 +110,7 @@ class Team:
     ## @property __members
     # @brief The team members
     # @details The ladder names of the players belong to the team.
+    # @note The list is replaced instead of changed, so getMembers() can be iterated safely.
 
     ## @property __name
     # @brief Team name
@@ -68,12 +120,6 @@ class Team:
     # @brief Internal id of the team
     # @details This is the id of the team needed for TEAM_NAME_id and TEAM_RED_id command
 
-    ## @property __ids
-    # @brief Set of used ids
-    # @details Set of currently used ids
-    # @private
-    __ids=set()
-
     ## @property zones
     # @brief Team zones
     # @details The zones belong to the team
@@ -82,80 +128,72 @@ class Team:
     # @brief The color of the team
     # @details Tuple of the r,g,b value of the color of the team.
 
+    ## @property __sent
+    # @brief The settings applied by applyChanges()
+    # @details Dictionary of the values, where the setting is the key.
+    # @private
+
     ## @brief Slots
     # @internal
-    __slots__=("__members","__name","__id","__ids","zones","color")
+    __slots__=("__members","__name","__id","zones","color","__sent")
 
     ## @brief Init function (Constructor)
     # @details Inits a new Team and adds properties.
     # @param name The initial team name
     # @param members Initial team members
-    # @exception RuntimeError Raised when the team is full (error code 2) or
-    #                         teams limit is reached (erro code 1).
+    # @exception AssertionError Raised if there's no free id.
+    # @note The id is released by Team.Remove().
     def __init__(self, name,*members):
-        if len(Team.__ids) == max_teams and max_teams > 0:
-            #raise RuntimeError("Maximal teams limit reached.",1) This should be handled by the server, not by the script.
-            pass
         self.__members=list()
         if len(members) != 0:
             self.__members=list(*members)
         self.__name=name
         self.zones=None
         self.color=0,0,1
-        id=-1
-        # get an unused id
-        i=0
-        while i<max_teams or max_teams<0:
-            if i not in Team.__ids:
-                id=i
-                break
-            i=i+1
-        del i
-        if id==-1:
-            log.error("Bug. Could not find any free id, but teams limit isn't reached.")
-            raise AssertionError("Could not find any free id.")
-        self.__id=id
-        Team.__ids.add(id)
-
-    ## @brief Del function (Destructor)
-    # @details Cleans up.
-    # @note Do not call this function directly. Use del \<instance\> instead.
-    def __del__(self):
-        try:
-            Team.__ids.remove(self.__id)
-            if(self.__name.lower()!="ai"):
-                log.debug("Removed id " + str(self.__id) + " from team id's list")
-        except AttributeError:
-            return
-        except KeyError:
-            return
-        except ValueError:
-            return
-            
+        self.__id=allocateId()
+        self.__sent=dict()
 
     ## @brief Sets the team name
-    # @details This function sets the name of the team.
+    # @details This function sets the name of the team. Another team with the same escaped
+    #          name is replaced, like Add() does.
     # @param name The new team name.
     def setName(self, name):
-        oldname=self.__name
-        self.__name=name
-        teams[self.getEscapedName()]=self
-        del teams[oldname]
+        global teams
+        with lock:
+            oldname=self.getEscapedName()
+            self.__name=name
+            new_teams=dict(teams)
+            if new_teams.get(oldname) is self:
+                del new_teams[oldname]
+            replaced=new_teams.get(self.getEscapedName())
+            if replaced!=None and replaced is not self:
+                releaseId(replaced.getId())
+            new_teams[self.getEscapedName()]=self
+            teams=new_teams
 
     ## @brief Applies all changes
     # @details You must call this function to apply changes on the name or
-    #          the color of the team
+    #          the color of the team. Only the settings that changed since the last call
+    #          are sent, all with one write.
     # @param force Force team name changes by setting TEAM_NAME_AFTER_PLAYER_teamid to 0?
     def applyChanges(self, force=True):
-        if force:
-            Armagetronad.SendCommand("TEAM_NAME_AFTER_PLAYER_{0} 1".format(self.__id) )
-        else:
-            Armagetronad.SendCommand("TEAM_NAME_AFTER_PLAYER_{0} 0".format(self.__id) )
-        Armagetronad.SendCommand("TEAM_NAME_{0} {1}".format(self.__id, self.__name) )
         r,g,b=self.color
-        Armagetronad.SendCommand("TEAM_RED_{0} {1}".format(self.__id,r) )
-        Armagetronad.SendCommand("TEAM_GREEN_{0} {1}".format(self.__id,g) )
-        Armagetronad.SendCommand("TEAM_BLUE_{0} {1}".format(self.__id,b) )
+        state=(("TEAM_NAME_AFTER_PLAYER_{0}", 1 if force else 0),
+               ("TEAM_NAME_{0}", self.__name),
+               ("TEAM_RED_{0}", r),
+               ("TEAM_GREEN_{0}", g),
+               ("TEAM_BLUE_{0}", b))
+        commands=[]
+        with lock:
+            for setting, value in state:
+                setting=setting.format(self.__id)
+                value=str(value)
+                if self.__sent.get(setting)==value:
+                    continue
+                self.__sent[setting]=value
+                commands.append(setting+" "+value)
+        Armagetronad.SendCommands(commands)
+
     ## @brief Adds a player to the team
     # @details This function adds the given player to the member list of the team.
     # @param name The ladder name of the player to add to the team.
@@ -164,17 +202,19 @@ class Team:
         if len(self.__members)==max_team_members:
             #raise RuntimeError("Team is full.",2) This should be handled by the server, not by the script.
             pass
-        if name not in self.__members:
-            self.__members.append(str(name) )
+        with lock:
+            if name not in self.__members:
+                self.__members=self.__members+[str(name)]
 
     ## @brief Removes a player from the team
     # @details This function removes the given player from the member list of the team.
     # @param name The ladder name of the player to remove from the team.
     # @exception RuntimeError Raised if the player isn't a member of the team.
     def removePlayer(self, name):
-        if name not in self.__members:
-            raise RuntimeError("Player {0} is not a member of team {1}".format(name,self.__name) )
-        self.__members.remove(name)
+        with lock:
+            if name not in self.__members:
+                raise RuntimeError("Player {0} is not a member of team {1}".format(name,self.__name) )
+            self.__members=[i for i in self.__members if i!=name]
 
     ## @brief Kills the whole team
     # @details This function kills all members of the team.
@@ -206,36 +246,26 @@ class Team:
     # @param offset The offset for back-moving the players.
     # @param shift The offset for moving the players left or right. Should be greater than 0
     # @param force Force the new position for each player? True if yes.
+    # @param shape Optional The name of the formation, see Formation.shapes.
     # @attention x and y coordinate are NOT relative to xdir and ydir.
     # @see Player::respawn
-    def respawn(self, x, y, xdir, ydir, offset, shift, force):
-        shift=abs(shift)
-        i=0
-        log.debug("Spawn team "+self.__name)
-        current_shift=0
-        hyp=math.sqrt(xdir**2 + ydir**2) # a² + b² = c²
-        cosa=ydir/hyp
-        sina=xdir/hyp
-        rotmat=[[cosa, -sina],
-                [sina,  cosa]]
-        relative_y=0
+    # @see RespawnTeams
+    def respawn(self, x, y, xdir, ydir, offset, shift, force, shape=None):
+        RespawnTeams([(self, x, y, xdir, ydir, offset, shift, force, shape)])
+
+    ## @brief Gets the members that exist.
+    # @details Returns the members of the team that are in Player.players, in the order of
+    #          their positions.
+    # @return List of ladder names.
+    def getSpawnMembers(self):
+        members=[]
         for playername in self.__members:
             if playername not in Player.players:
                 log.error("Found non-existing player " + playername +
                             " as a member of a team. This might be a Bug.")
                 continue
-            factor=1
-            if i%2==1:
-                factor=-1
-            relative_x=current_shift*factor
-            rotated_x=rotmat[0][0]*relative_x+rotmat[0][1]*relative_y
-            rotated_y=rotmat[1][0]*relative_x+rotmat[1][1]*relative_y
-            Player.players[playername].respawn(x+rotated_x,y+rotated_y,xdir,ydir,force)
-            log.debug("Player "+playername+" spawned at "+str(x+rotated_x)+"|"+str(y+rotated_y) )
-            i=i+1
-            if i%2==1:
-                current_shift=current_shift+shift
-            relative_y=relative_y-i%2*offset
+            members.append(playername)
+        return members
 
     ## @brief Shuffles an player
     # @details Moves the given player to the given position in the team.
@@ -244,10 +274,12 @@ class Team:
     # @exception RuntimeError Raised if the player is not a meber of the team or
     #                         does not exist.
     def shufflePlayer(self, player, pos):
-        if player not in self.__members:
-            raise RuntimeError("Player {0} is not a member of team {1}".format(player, self.__name) )
-        self.__members.remove(player)
-        self.__members[pos:pos]=[player]
+        with lock:
+            if player not in self.__members:
+                raise RuntimeError("Player {0} is not a member of team {1}".format(player, self.__name) )
+            members=[i for i in self.__members if i!=player]
+            members[pos:pos]=[player]
+            self.__members=members
 
     ## @brief Gets the position of the player
     # @details Returns the position of the given player in the team.
@@ -270,11 +302,38 @@ class Team:
     def getName(self):
         return self.__name
 
+    ## @brief Returns the id of the team
+    # @return The id used for the TEAM_NAME_id and TEAM_RED_id commands.
+    def getId(self):
+        return self.__id
+
     ## @brief Returns the members of the team
     # @return List of members of the team
     def getMembers(self):
         return self.__members
 
+## @brief Respawns several teams
+# @details Computes the positions of the members of all given teams at once and sends all
+#          RESPAWN_PLAYER commands with one write.
+# @param spawns List of (team, x, y, xdir, ydir, offset, shift, force, shape) tuples. team is
+#               a Team or the escaped name of a team. See Team.respawn for the other values.
+def RespawnTeams(spawns):
+    members=[]
+    params=[]
+    for team, x, y, xdir, ydir, offset, shift, force, shape in spawns: #@UnusedVariable
+        if type(team)==str:
+            team=teams[team]
+        log.debug("Spawn team "+team.getName())
+        members.append(team.getSpawnMembers())
+        params.append((len(members[-1]), x, y, xdir, ydir, offset, shift, shape))
+    commands=[]
+    for spawn, team_members, positions in zip(spawns, members, Formation.compute(params)):
+        xdir, ydir, force=spawn[3], spawn[4], spawn[7]
+        for playername, (x, y) in zip(team_members, positions):
+            commands+=Player.players[playername].getRespawnCommands(x, y, xdir, ydir, force)
+            log.debug("Player "+playername+" spawned at "+str(x)+"|"+str(y) )
+    Armagetronad.SendCommands(commands)
+
 ## @brief Enables logging
 # @details This function enables logging for this module.
 # @param h The handler used for logging
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+## @file benchmark.py
+# @brief Ladderlog replay benchmark
+# @details Feeds synthetic or recorded ladderlog streams through parser.main and the
+#          LadderLogHandlers. The commands the script writes go through run.OutputToProcess
+#          to a stub server process that only counts them. Every scenario runs in its own
+#          process, so the state and the peak memory of one doesn't affect the others.
+#
+#          Reported for every scenario: events per second, p50 and p99 of the time needed to
+#          handle one event, commands written per event and the peak RSS. Chat commands run
+#          in the worker threads of CommandQueue, so the time per event only covers submitting
+#          them. The p50 and p99 of the time they waited for a worker are reported as well.
+#
+#          Example: ./benchmark.py -s deaths -s gridpos -n 50000
+
+import os
+import sys
+import json
+import time
+import random
+import resource
+import subprocess
+import tempfile
+from optparse import OptionParser
+
+## @brief Code of the stub server.
+# @details Counts the commands it receives after the start marker and prints the count
+#          when its stdin is closed.
+STUB_SERVER="""
+import sys
+count=-1
+for line in sys.stdin.buffer:
+    if count<0:
+        if line.startswith(b"#BENCHMARK_START"):
+            count=0
+        continue
+    count+=1
+print(max(count, 0))
+"""
+
+## @brief The available scenarios
+# @details Dictionary of functions that return the lines of the ladderlog, where the name
+#          of the scenario is the key. The functions get the number of events and the number
+#          of players.
+scenarios=dict()
+
+## @brief Adds a scenario
+# @details Decorator.
+# @param name The name of the scenario.
+def scenario(name):
+    def register(func):
+        scenarios[name]=func
+        return func
+    return register
+
+## @brief Lines that let players join.
+def joinLines(players):
+    return ["PLAYER_ENTERED player{0} 10.0.{1}.{2} Player {0}".format(i, i//250, i%250+1) for i in range(players)]
+
+## @brief Players joining and leaving.
+@scenario("joins")
+def joins(events, players):
+    ret=[]
+    while len(ret)<events:
+        ret+=joinLines(players)
+        ret+=["PLAYER_LEFT player{0} 10.0.{1}.{2}".format(i, i//250, i%250+1) for i in range(players)]
+    return ret[:events]
+
+## @brief Players renaming back and forth.
+@scenario("renames")
+def renames(events, players):
+    ret=joinLines(players)
+    names=["player{0}".format(i) for i in range(players)]
+    while len(ret)<events:
+        i=len(ret)%players
+        new="player{0}_{1}".format(i, len(ret)//players%2)
+        ret.append("PLAYER_RENAMED {0} {1} 10.0.{2}.{3} 0 Player {1}".format(names[i], new, i//250, i%250+1))
+        names[i]=new
+    return ret[:events]
+
+## @brief Chat commands of all players.
+# @details The players have the access level 0, so the commands pass the access check
+#          without an access.yaml.
+@scenario("commands")
+def commands(events, players):
+    ret=joinLines(players)
+    commands=[("/info", ""), ("/info", "commands"), ("/yes", ""), ("/no", ""), ("/mode", ""), ("/nosuchcommand", "")]
+    while len(ret)<events:
+        i=len(ret)%players
+        command, args=commands[len(ret)%len(commands)]
+        ret.append("INVALID_COMMAND {0} player{1} 10.0.{2}.{3} 0 {4}".format(command, i, i//250, i%250+1, args).rstrip())
+    return ret[:events]
+
+## @brief Rounds with bursts of deaths.
+@scenario("deaths")
+def deaths(events, players):
+    ret=joinLines(players)
+    events_per_death=["DEATH_FRAG", "DEATH_SUICIDE", "DEATH_TEAMKILL", "DEATH_SHOT_FRAG"]
+    while len(ret)<events:
+        ret.append("ROUND_COMMENCING 2 10")
+        for i in range(players):
+            ret.append("CYCLE_CREATED player{0} {1} 10 0 1".format(i, i*5))
+        for i in range(players):
+            ret.append("{0} player{1} player{2}".format(events_per_death[i%len(events_per_death)], i, (i+1)%players))
+    return ret[:events]
+
+## @brief Rounds and matches without much happening.
+@scenario("rounds")
+def rounds(events, players):
+    ret=joinLines(players)
+    round_num=1
+    while len(ret)<events:
+        ret.append("NEW_ROUND 2026-10-18 12:00:00 UTC")
+        ret.append("ROUND_COMMENCING {0} 10".format(round_num))
+        for i in range(players):
+            ret.append("ONLINE_PLAYER player{0} 15 {1} 0 50".format(i, i%16))
+        ret.append("WAIT_FOR_EXTERNAL_SCRIPT")
+        round_num=round_num%10+1
+    return ret[:events]
+
+## @brief Floods of PLAYER_GRIDPOS.
+@scenario("gridpos")
+def gridpos(events, players):
+    ret=joinLines(players)
+    while len(ret)<events:
+        i=len(ret)%players
+        ret.append("PLAYER_GRIDPOS player{0} {1:.3f} {2:.3f} 0 1 1 player{0}".format(i, random.uniform(0, 500), random.uniform(0, 500)))
+    return ret[:events]
+
+## @brief Lines that rename the players back to their original names.
+# @param lines The lines that renamed the players.
+def renameBackLines(lines, players):
+    names=dict(("player{0}".format(i), i) for i in range(players)) # Current name: player number
+    for line in lines:
+        if line.startswith("PLAYER_RENAMED "):
+            old, new=line.split(" ")[1:3]
+            names[new]=names.pop(old)
+    return ["PLAYER_RENAMED {0} player{1} 10.0.{2}.{3} 0 Player player{1}".format(name, i, i//250, i%250+1)
+            for name, i in sorted(names.items(), key=lambda x: x[1]) if name!="player{0}".format(i)]
+
+## @brief A bit of everything.
+# @details The players get their original names back after renaming, so the other
+#          generators can use them.
+@scenario("mixed")
+def mixed(events, players):
+    ret=joinLines(players)
+    generators=[renames, commands, deaths, rounds, gridpos]
+    chunk=max(players*4, 100)
+    i=0
+    while len(ret)<events:
+        lines=generators[i%len(generators)](chunk+players, players)[players:] # Players already joined
+        if generators[i%len(generators)]==renames:
+            lines+=renameBackLines(lines, players)
+        ret+=lines
+        i+=1
+    return ret[:events]
+
+## @brief sys.stdin replacement that hands out the lines and measures.
+# @details The time between two reads is the time parser.main needed for one event.
+#          Raises KeyboardInterrupt after the last line, which stops parser.main.
+class ReplayInput():
+    def __init__(self, lines):
+        self.lines=iter(lines)
+        self.times=[]
+        self.start=None
+        self.end=None
+        self.last=None
+    def readline(self):
+        now=time.perf_counter()
+        if self.last==None:
+            # Setup of parser.main is done. Don't count its commands.
+            sys.stdout.write("#BENCHMARK_START\n")
+            sys.stdout.flush()
+            now=self.start=time.perf_counter()
+        else:
+            self.times.append(now-self.last)
+        try:
+            line=next(self.lines)
+        except StopIteration:
+            self.end=now
+            raise KeyboardInterrupt()
+        self.last=time.perf_counter()
+        return line+"\n"
+
+## @brief Gets a percentile of a sorted list.
+def percentile(values, p):
+    if not values:
+        return 0
+    return values[min(len(values)-1, len(values)*p//100)]
+
+## @brief Runs one scenario in this process.
+# @param lines The lines of the ladderlog.
+# @param workdir The directory in which the script writes its files.
+# @param load_extensions Load the extensions?
+# @return Dictionary of the results.
+def runScenario(lines, workdir, load_extensions=True):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    import run
+    import parser
+    import Settings
+    import GridPos
+    import CommandQueue
+    run.p=subprocess.Popen([sys.executable, "-c", STUB_SERVER], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    sys.stdout=run.OutputToProcess()
+    Settings.Record("CYCLE_RUBBER", "1") # So nobody waits for the server.
+    if load_extensions:
+        run.extensions.loadExtensions()
+    if any(line.startswith("PLAYER_GRIDPOS") for line in lines):
+        GridPos.Subscribe()
+    replay=ReplayInput(lines)
+    sys.stdin=replay
+    parser.main()
+    # Wait for chat commands that are still running.
+    deadline=time.time()+10
+    while time.time()<deadline:
+        stats=CommandQueue.Stats()
+        if not stats.get("queued") and not stats.get("running"):
+            break
+        time.sleep(0.01)
+    sys.stdout.flush()
+    run.p.stdin.close()
+    written=int(run.p.stdout.read().strip() or 0)
+    run.p.wait()
+    times=sorted(replay.times)
+    events=len(times)
+    duration=(replay.end or time.perf_counter())-replay.start
+    stats=CommandQueue.Stats()
+    return {"events": events,
+            "events_per_second": events/duration if duration else 0,
+            "latency_p50": percentile(times, 50),
+            "latency_p99": percentile(times, 99),
+            "commands_per_event": written/events if events else 0,
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024,
+            "rejected_commands": stats.get("rejected", 0),
+            "command_wait_p50": stats.get("latency_p50"),
+            "command_wait_p99": stats.get("latency_p99")}
+
+## @brief Formats seconds as microseconds.
+# @details Returns "-" for None.
+def formatMicroseconds(seconds):
+    if seconds==None:
+        return "-"
+    return "{0:.1f}".format(seconds*1e6)
+
+## @brief Prints the results as a table.
+# @details cmd p50 and cmd p99 are the times chat commands waited for a worker.
+def printResults(results):
+    header="{0:<12} {1:>8} {2:>11} {3:>10} {4:>10} {5:>14} {6:>14} {7:>9} {8:>9}"
+    print(header.format("scenario", "events", "events/s", "p50 [us]", "p99 [us]", "cmd p50 [us]", "cmd p99 [us]", "cmds/ev", "RSS [MB]"))
+    for name, result in results:
+        if result==None:
+            print("{0:<12} failed".format(name))
+            continue
+        print(header.format(name, result["events"], "{0:.0f}".format(result["events_per_second"]),
+                            formatMicroseconds(result["latency_p50"]), formatMicroseconds(result["latency_p99"]),
+                            formatMicroseconds(result["command_wait_p50"]), formatMicroseconds(result["command_wait_p99"]),
+                            "{0:.2f}".format(result["commands_per_event"]), "{0:.1f}".format(result["peak_rss"]/2**20)))
+
+def main():
+    oparser=OptionParser()
+    oparser.add_option("-s", "--scenario", dest="scenarios", action="append", default=[], help="Run SCENARIO. Can be given several times. Available: "+", ".join(sorted(scenarios))+". Default: all.", metavar="SCENARIO")
+    oparser.add_option("-l", "--ladderlog", dest="ladderlog", default=None, help="Replay the recorded ladderlog FILE instead of the synthetic scenarios.", metavar="FILE")
+    oparser.add_option("-n", "--events", dest="events", type="int", default=20000, help="Number of events of each scenario.", metavar="COUNT")
+    oparser.add_option("-p", "--players", dest="players", type="int", default=32, help="Number of players.", metavar="COUNT")
+    oparser.add_option("--seed", dest="seed", type="int", default=0, help="Seed for the random positions.")
+    oparser.add_option("--no-extensions", dest="extensions", default=True, action="store_false", help="Don't load the extensions.")
+    oparser.add_option("--json", dest="json", default=False, action="store_true", help="Print the results as JSON.")
+    oparser.add_option("--verbose", dest="verbose", default=False, action="store_true", help="Show the output of the script.")
+    oparser.add_option("--child", dest="child", default=False, action="store_true", help="Internal: Run a single scenario in this process.")
+    options=oparser.parse_args()[0]
+    random.seed(options.seed)
+    if options.child:
+        if options.ladderlog:
+            with open(options.ladderlog, encoding="latin-1") as f:
+                lines=[line.rstrip("\n") for line in f]
+        else:
+            lines=scenarios[options.scenarios[0]](options.events, options.players)
+        workdir=tempfile.TemporaryDirectory(prefix="aamms-benchmark-")
+        try:
+            result=runScenario(lines, workdir.name, options.extensions)
+        finally:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+            workdir.cleanup()
+        sys.__stdout__.write(json.dumps(result)+"\n")
+        sys.__stdout__.flush()
+        os._exit(0) # Don't wait for the worker threads.
+    if options.ladderlog:
+        names=[os.path.basename(options.ladderlog)]
+    else:
+        names=options.scenarios or sorted(scenarios)
+        for name in names:
+            if name not in scenarios:
+                oparser.error("Unknown scenario "+name)
+    results=[]
+    for name in names:
+        args=[sys.executable, os.path.abspath(__file__), "--child", "-n", str(options.events),
+              "-p", str(options.players), "--seed", str(options.seed)]
+        if options.ladderlog:
+            args+=["-l", os.path.abspath(options.ladderlog)]
+        else:
+            args+=["-s", name]
+        if not options.extensions:
+            args.append("--no-extensions")
+        child=subprocess.run(args, stdout=subprocess.PIPE, stderr=None if options.verbose else subprocess.DEVNULL)
+        try:
+            results.append((name, json.loads(child.stdout.decode().strip().splitlines()[-1])))
+        except (ValueError, IndexError):
+            results.append((name, None))
+    if options.json:
+        print(json.dumps(dict(results), indent=2))
+    else:
+        printResults(results)
+
+if __name__=="__main__":
+    main()
@@ -11,6 +11,7 @@ import random
 import Armagetronad
 import logging
 import LadderLogHandlers
+import Scheduler
 import yaml
 from glob import glob
 import os.path
@@ -270,13 +271,14 @@ class Mode(yaml.YAMLObject):
             else:
                 kill=False
         settings_prefix=settings_prefix.rstrip("/")
+        Scheduler.CancelGroup("mode") # Delayed settings of the previous mode must not be applied anymore.
         Armagetronad.SendCommand("START_NEW_MATCH")
         if self.settings_file != None:
             Armagetronad.SendCommand("INCLUDE {0}/{1}".format(settings_prefix, self.settings_file) )
         Armagetronad.SendCommand("TEAMS_MAX "+str(self.max_teams) )
         Armagetronad.SendCommand("TEAM_MAX_PLAYERS "+str(self.max_team_members) )
         for setting, value, delay in self.settings.items():
-            Armagetronad.SendCommand("{0} {1}".format(setting,value), delay)
+            Armagetronad.SendCommand("{0} {1}".format(setting,value), delay, group="mode")
         Team.max_teams=self.max_teams
         Team.max_team_members=self.max_team_members
         if kill == True:
@@ -291,14 +293,27 @@ class Mode(yaml.YAMLObject):
     def spawnTeams(self):
         i=0
         log.debug("Spawn teams ...")
-        for team in Team.teams:
+        spawns=[]
+        for name, team in Team.teams.items():
             try:
                 respoint=self.__getRespoint("roundstart",i)
                 x,y,xdir,ydir=respoint[1:]
-                Team.teams[team].respawn(x,y,xdir,ydir,1,1,True)
+                if xdir==0 and ydir==0:
+                    raise RuntimeError("Invalid direction 0|0")
+                spawns.append((team,x,y,xdir,ydir,1,1,True,None))
             except Exception as e:
-                log.error("Could not spawn team {0}: {1}".format(str(team),str(e)) )
+                log.error("Could not spawn team {0}: {1}".format(str(name),str(e)) )
             i=i+1
+        try:
+            Team.RespawnTeams(spawns)
+        except Exception as e:
+            # Spawn the teams one by one, so only the bad team isn't spawned.
+            log.error("Could not spawn the teams at once: "+str(e))
+            for spawn in spawns:
+                try:
+                    Team.RespawnTeams([spawn])
+                except Exception as e:
+                    log.error("Could not spawn team {0}: {1}".format(spawn[0].getName(),str(e)) )
 
     ## @brief Spawns all zones
     # @details Spawns all zones related to the mode
@@ -309,15 +324,15 @@ class Mode(yaml.YAMLObject):
                 for team in Team.teams.values():
                     zone.color=team.color
                     zone.teamnames=[team.getEscapedName(),]
-                    zone.spawn(delay=delay)
+                    zone.spawn(delay=delay, group="round")
                 return
             elif team == -1:
-                    zone.spawn(delay=delay)
+                    zone.spawn(delay=delay, group="round")
             else:
                 if len(Team.teams)-1 < team-1:
                     continue
                 zone.teamnames=[list(Team.teams.keys())[team-1]]
-                zone.spawn(delay=delay)
+                zone.spawn(delay=delay, group="round")
     ## @brief Gets a respoint
     # @details Gets a respoint for roundstart or normal for the given team
     # @param mode The mode which to use (roundstart, normal)
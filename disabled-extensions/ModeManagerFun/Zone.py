@@ -7,8 +7,7 @@ import Armagetronad
 import logging
 import Team
 import yaml
-import time
-from multiprocessing import Process as Thread
+import Scheduler
 ## @brief The logging object
 # @private
 # @details Used for logging by this module
@@ -142,15 +141,11 @@ class Zone(yaml.YAMLObject):
     ## @brief Spawns the zone
     # @details Spawns the zone and sets alive to True
     # @param delay Spawn after delay secounds.
-    def spawn(self, delay=0):
+    # @param group Optional Scheduler group of the delayed spawn.
+    # @return A Scheduler.Job if the spawn was delayed, None otherwise.
+    def spawn(self, delay=0, group=None):
         if delay != 0:
-            def run(delay, func):
-                time.sleep(delay)
-                func()
-            t=Thread(None, run, args=(delay, self.spawn))
-            t.daemon(True)
-            t.start()
-            return
+            return Scheduler.Add(delay, self.spawn, group=group)
         name=""
         teams=list()
         command=str("SPAWN_ZONE {name} {type} {teams} {x} {y} {radius} {grow} {dirx} {diry} "
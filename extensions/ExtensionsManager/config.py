@@ -0,0 +1,15 @@
+## @file config.py
+#  @brief Manifest of the ExtensionsManager extension.
+#  @details Read by the extension loader without running it. See the extensions package.
+
+deps=[]
+lazy=True
+groups={"extensions": "Extension management tools"}
+commands={"loadExt": "extensions", "unloadExt": "extensions", "listExt": "extensions"}
+help={"loadExt": {"brief": "Load an extension",
+                  "args": ["name"],
+                  "params": {"name": "The name of the extension to load."}},
+      "unloadExt": {"brief": "Unload an extension",
+                    "args": ["name"],
+                    "params": {"name": "The name of the extension to unload."}},
+      "listExt": {"brief": "List all available extensions."}}
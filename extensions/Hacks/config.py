@@ -0,0 +1,18 @@
+## @file config.py
+#  @brief Manifest of the Hacks extension.
+#  @details Read by the extension loader without running it. See the extensions package.
+
+deps=[]
+lazy=True
+groups={"Hacks": "Some commands that allow cheating"}
+commands={"lives": "Hacks", "tele": "Hacks"}
+help={"lives": {"brief": "Changes your lives.",
+                "args": ["lives"],
+                "params": {"lives": "new lives"}},
+      "tele": {"brief": "Teleports a player to the given position.",
+               "args": ["x", "y", "xdir=0", "ydir=1", "player_name=None"],
+               "params": {"x": "The x coordinate to which to teleport",
+                          "y": "The y coordinate to which to teleport",
+                          "xdir": "The x direction",
+                          "ydir": "The y direction",
+                          "player_name": "The player which you like to teleport. If set to None, you teleport yourself."}}}
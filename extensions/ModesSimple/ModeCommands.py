@@ -103,15 +103,20 @@ def mode(acl, player, modename, when=None):
             act=lambda: activator("roundend")
             if SimpleMode.current_mode and SimpleMode.current_mode.lives>10:
                 act=lambda: activator("now")
-            Poll.Add(target, act, player)
-            Poll.current_poll.SetPlayerVote(player, True)
-            Poll.current_poll.CheckResult(only_sure=True)
+            poll=Poll.Add(target, act, player, kind="mode")
         except RuntimeError as r:
             if r.args[1]==1:
                 Armagetronad.PrintPlayerMessage(player, Messages.PollAlreadyActive)
             elif r.args[1]==2:
                 Armagetronad.PrintPlayerMessage(player, Messages.SpecNotAllowed)
-                Poll.Cancel()
+            return
+        try:
+            poll.SetPlayerVote(player, True)
+            poll.CheckResult(only_sure=True)
+        except RuntimeError as r:
+            if r.args[1]==2:
+                Armagetronad.PrintPlayerMessage(player, Messages.SpecNotAllowed)
+                Poll.Cancel(poll)
             return
     elif ctype=="set":
         when=when.lower()
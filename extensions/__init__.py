@@ -1,14 +1,44 @@
+## @package extensions
+# @brief Extension loader
+# @details Every directory in this package with an __init__.py is an extension. An extension
+#          can have a config.py, its manifest. It's read without running it, so it may only
+#          contain assignments of literals:
+#          - deps: List of the names of the extensions that must be loaded first.
+#          - lazy: If True, the extension is only imported when one of its commands is used.
+#                  Only for extensions that do nothing else than registering commands.
+#          - commands: Dictionary of the help group of each command, where the name of the
+#                      command is the key. Needed for lazy extensions.
+#          - groups: Dictionary of the descriptions of the help groups, where the group is the key.
+#          - help: Dictionary of the help of the commands of lazy extensions, where the name of
+#                  the command is the key. The values are dictionaries with the keys brief,
+#                  args and params, see Commands.describeCommand.
+#          Extensions that don't depend on each other are imported in parallel.
+
 import glob
-import imp
 import sys
-import Global
+import ast
+import threading
+import importlib.util
 import os.path
+from concurrent.futures import ThreadPoolExecutor
+import Global
 import LadderLogHandlers, Commands
 import tools
 __save_vars=["loadedExtensions"]
 
 loadedExtensions=[]
 
+## @brief Lazy extensions that weren't imported yet
+# @details Dictionary of the manifests, where the name of the extension is the key.
+lazyExtensions=dict()
+
+## @brief Maximal number of extensions imported at the same time.
+max_workers=4
+
+## @brief Protects loadedExtensions and lazyExtensions while extensions are loaded.
+# @private
+__lock=threading.RLock()
+
 def getExtensions():
     root=os.path.dirname(os.path.abspath(__file__))
     extensions=[]
@@ -17,64 +47,212 @@ def getExtensions():
         extensions+=[i]
     return extensions
 
+## @brief Reads the manifest of an extension.
+# @details Only top level assignments of literals are read, the file is never executed.
+# @param name The name of the extension.
+# @return Dictionary with the keys deps, lazy, commands, groups and help.
+def readManifest(name):
+    manifest={"deps": [], "lazy": False, "commands": {}, "groups": {}, "help": {}}
+    path=os.path.join(__path__[0], name, "config.py")
+    if not os.path.exists(path):
+        return manifest
+    with open(path) as f:
+        tree=ast.parse(f.read(), path)
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets)!=1 or not isinstance(node.targets[0], ast.Name):
+            continue
+        try:
+            manifest[node.targets[0].id]=ast.literal_eval(node.value)
+        except ValueError:
+            sys.stderr.write("[EXTENSION] Ignoring "+node.targets[0].id+" in the manifest of "+name+". It's not a literal.\n")
+    if manifest["lazy"] and not manifest["commands"]:
+        manifest["lazy"]=False
+    return manifest
+
+## @brief Sorts extensions by their dependencies.
+# @details Extensions in the same level don't depend on each other and can be imported
+#          at the same time.
+# @param manifests Dictionary of the manifests of the extensions to sort, where the name is the key.
+# @param loaded Names of the extensions that are already loaded.
+# @return Tuple of the list of levels and a dictionary of the dependencies that can't be
+#         loaded, where the name of the extension is the key.
+def resolveDependencies(manifests, loaded=()):
+    missing=dict()
+    for name, manifest in manifests.items():
+        deps=[i for i in manifest["deps"] if i not in loaded and i not in manifests]
+        if deps:
+            missing[name]=deps
+    levels=[]
+    done=set(loaded)
+    todo=set(manifests)-set(missing)
+    while todo:
+        level=sorted(name for name in todo if all(dep in done for dep in manifests[name]["deps"]))
+        if not level:
+            break
+        levels.append(level)
+        done.update(level)
+        todo.difference_update(level)
+    for name in todo: # Depending on a missing extension or part of a cycle
+        missing[name]=[i for i in manifests[name]["deps"] if i not in done]
+    return levels, missing
+
+## @brief Imports an extension.
+# @private
+# @return The module, or None if importing failed.
+def __importExtension(name):
+    path=os.path.join(__path__[0], name)
+    spec=importlib.util.spec_from_file_location(name, os.path.join(path, "__init__.py"), submodule_search_locations=[path])
+    module=importlib.util.module_from_spec(spec)
+    sys.modules[name]=module
+    Commands.setOwner(name)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException as b:
+        del sys.modules[name]
+        if Global.debug:
+            raise b
+        sys.stderr.write("[EXTENSION] Loading "+name+" ... Error: "+str(b)+"\n")
+        return None
+    finally:
+        Commands.setOwner(None)
+    sys.stderr.write("[EXTENSION] Loading "+name+" ... Ok\n")
+    return module
+
+## @brief Registers the commands of a lazy extension.
+# @details The extension is imported when one of the commands is used first.
+# @private
+def __registerLazyCommands(name, manifest):
+    Commands.setOwner(name)
+    try:
+        for group, desc in manifest["groups"].items():
+            Commands.add_help_group(group, desc)
+        for command, group in manifest["commands"].items():
+            func=__lazyCommand(name, command)
+            Commands.register_commands(func, group=group)
+            Commands.describeCommand(command, **manifest["help"].get(command, {}))
+    finally:
+        Commands.setOwner(None)
+    lazyExtensions[name]=manifest
+    sys.stderr.write("[EXTENSION] Registered "+name+", it's loaded on first use.\n")
+
+## @brief Creates a placeholder for a command of a lazy extension.
+# @private
+def __lazyCommand(name, command):
+    # The help is set from the manifest, see __registerLazyCommands.
+    def func(acl, player, *args):
+        import Armagetronad
+        if loadExtension(name, lazy=False) or Commands.commands.get(command) is func:
+            Armagetronad.PrintPlayerMessage(player, "0xff0000Could not load the extension "+name+".")
+            return
+        if not Commands.checkUsage(command, acl, *args):
+            Armagetronad.PrintPlayerMessage(player, Commands.getHelp(command, acl))
+            return
+        Commands.commands[command](acl, player, *args)
+    func.__name__=command
+    func.__qualname__=command
+    func.__module__=name
+    return func
+
+## @brief Loads several extensions.
+# @details Dependencies are loaded first, extensions that don't depend on each other are
+#          imported in parallel.
+# @param names Names of the extensions to load.
+# @param lazy If False, lazy extensions are imported as well. If None, the manifest decides.
+# @return Dictionary of the extensions that failed to load, where the name is the key. The
+#         value is True if importing failed, or a list of the missing dependencies.
+def loadExtensionsByName(names, lazy=None):
+    with __lock:
+        loaded=[i.__name__ for i in loadedExtensions]
+        manifests=dict()
+        todo=[i for i in names if i not in loaded]
+        while todo:
+            name=todo.pop()
+            if name in manifests or name not in getExtensions():
+                continue
+            manifests[name]=readManifest(name)
+            todo.extend(i for i in manifests[name]["deps"] if i not in loaded)
+        failed=dict()
+        levels, missing=resolveDependencies(manifests, loaded)
+        for name in missing:
+            sys.stderr.write("[EXTENSION] Can't load "+name+", missing dependencies: "+", ".join(missing[name])+"\n")
+            failed[name]=missing[name]
+        eager=set(i for i in names if lazy==False)
+        for manifest in manifests.values():
+            eager.update(manifest["deps"]) # Others use the code
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for level in levels:
+                imports=[]
+                for name in level:
+                    if any(dep in failed for dep in manifests[name]["deps"]):
+                        failed[name]=[dep for dep in manifests[name]["deps"] if dep in failed]
+                    elif manifests[name]["lazy"] and name not in eager:
+                        if name not in lazyExtensions:
+                            __registerLazyCommands(name, manifests[name])
+                    else:
+                        imports.append(name)
+                for name, module in zip(imports, executor.map(__importExtension, imports)):
+                    if module==None:
+                        failed[name]=True
+                        continue
+                    lazyExtensions.pop(name, None)
+                    loadedExtensions.append(module)
+        return failed
+
 def unloadExtension(name):
     name=[x for x in getExtensions() if x.lower()==name.lower()]
     if not len(name):
         return True
     name=name[0]
     global loadedExtensions
-    module=[i for i in loadedExtensions if i.__name__==name]
-    if len(module)!=1:
-        return False
-    module=module[0]
-    loadedExtensions.remove(module)
+    with __lock:
+        if name in lazyExtensions:
+            del lazyExtensions[name]
+            Commands.unregister_package(name)
+            sys.stderr.write("[EXTENSION] Unloaded extension "+name+"\n")
+            return
+        module=[i for i in loadedExtensions if i.__name__==name]
+        if len(module)!=1:
+            return False
+        module=module[0]
+        loadedExtensions.remove(module)
     tools.delete_modules_from_dir(os.path.join("extensions", name))
     LadderLogHandlers.unregister_package(module.__name__)
     Commands.unregister_package(module.__name__)
     sys.stderr.write("[EXTENSION] Unloaded extension "+module.__name__+"\n")
 
-def loadExtension(name, skip_dependency_check=False):
-    global loadedExtensions
-    sys.path.append(__path__)
-    name=[i for i in getExtensions() if i.lower()==name.lower()]
-    if len(name)<1:
+## @brief Loads an extension and the extensions it depends on.
+# @param name The name of the extension, in any case.
+# @param skip_dependency_check Load the extension even if dependencies are missing?
+# @param lazy If False, the extension is imported even if its manifest says it's lazy.
+# @return False on success, True if importing failed, or the list of missing dependencies.
+def loadExtension(name, skip_dependency_check=False, lazy=None):
+    real_name=[i for i in getExtensions() if i.lower()==name.lower()]
+    if len(real_name)<1:
         raise RuntimeError("Trying to load Extension "+name+", but it doesn't exists.")
-    name=name[0]
-    if name in [i.__name__ for i in loadedExtensions]:
-        return True
-    if os.path.exists(__path__[0]+"/"+name+"/config.py"):
-        config=imp.new_module("extensions/"+name+"/config")
-        loadedExtNames=[i.__name__ for i in loadedExtensions]
-        if hasattr(config, "deps"):
-            missing_deps=[i for i in config.deps if i not in loadedExtNames]
-            if len(missing_deps) and not skip_dependency_check:
-                return missing_deps
-    sys.stderr.write("[EXTENSION] Loading "+name+" ... ")
-    sys.stderr.flush()
-    try:
-        imp.acquire_lock()
-        loadedExtensions+=[imp.load_module(name, *imp.find_module("extensions/"+name))]
-    except BaseException as b: #@UnusedVariable
-        if Global.debug:
-            raise b
-        sys.stderr.write("Error\n")
-        return True
-    else:
-        sys.stderr.write("Ok\n")
-    finally:
-        imp.release_lock()
-    sys.stderr.flush()
+    name=real_name[0]
+    failed=loadExtensionsByName([name], lazy)
+    if name not in failed:
+        return False
+    if failed[name]==True or not skip_dependency_check:
+        return failed[name]
+    with __lock:
+        module=__importExtension(name)
+        if module==None:
+            return True
+        lazyExtensions.pop(name, None)
+        loadedExtensions.append(module)
     return False
 
 def loadExtensions():
-    global loadedExtensions
-    sys.path.append(__path__)
-    for i in getExtensions():
-        missing_deps=loadExtension(i) #@UnusedVariable
+    loadExtensionsByName(getExtensions())
+
 def __del__():
-    global loadedExtensions 
+    global loadedExtensions
     for i in range(len(loadedExtensions)):
         del loadedExtensions[0] # Always delete first element, so next gets first.
 
 def __reload__(loadedExtensions__old):
+    global loadedExtensions
+    # Empty if the extensions were deleted, otherwise only this module was reloaded.
+    loadedExtensions=loadedExtensions__old
     loadExtensions()
@@ -8,8 +8,11 @@ import Global
 import Commands
 import Poll
 import Player
+import Scheduler
+import CommandQueue
+import Settings
 import time
-import inspect
+import sys
 
 log=logging.getLogger("MainModule")
 
@@ -30,14 +33,13 @@ def main(debug=False, disabledCommands=[], reloaded=False):
         h.setFormatter(f)
         log.addHandler(h)
         log.setLevel(logging.INFO)
+    if Global.serverlog:
+        Settings.WatchServerlog(Global.serverlog)
     #We need some special settings. Set it
     Global.set_script_settings()
-    for x in dir(LadderLogHandlers):
-        if not x[0].isupper():
-            continue
-        if inspect.isfunction(getattr(LadderLogHandlers,x)):
-            x="".join([i.upper() if i.islower() else "_"+i for i in x])
-            Armagetronad.SendCommand("LADDERLOG_WRITE"+x+" 1") # X has already a underscore at beginning.
+    for event in LadderLogHandlers.builtinHandlers:
+        Armagetronad.SendCommand("LADDERLOG_WRITE_"+event+" 1")
+    LadderLogHandlers.rebuildDispatchTable()
     if not reloaded:
         if Global.debug:
             log.info("Starting in debug mode.")
@@ -45,11 +47,15 @@ def main(debug=False, disabledCommands=[], reloaded=False):
             Team.enableLogging(logging.DEBUG)
             LadderLogHandlers.enableLogging(logging.DEBUG)
             Poll.enableLogging(logging.DEBUG)
+            Scheduler.enableLogging(logging.DEBUG)
+            CommandQueue.enableLogging(logging.DEBUG)
         else:
             Player.enableLogging(logging.WARNING)
             Team.enableLogging(logging.WARNING)
             LadderLogHandlers.enableLogging(logging.INFO)
             Poll.enableLogging(logging.WARNING)
+            Scheduler.enableLogging(logging.WARNING)
+            CommandQueue.enableLogging(logging.WARNING)
 
     Commands.disabled=Commands.disabled+disabledCommands    
     #Init
@@ -59,38 +65,37 @@ def main(debug=False, disabledCommands=[], reloaded=False):
         Armagetronad.PrintMessage("0xff0000Script started")
     else:
         log.info("Script reloaded")
+        if hasattr(sys.stdin, "pending"):
+            count, age=sys.stdin.pending()
+            if count:
+                log.info("Handling {0} ladderlog events that happened during the last {1:.1f} seconds.".format(count, age))
     #We need to refresh player list
     Global.reloadPlayerList()
     while(True):
         line=""
         if Global.handleLadderLog==False:
-            time.sleep(1)
+            time.sleep(0.01) # Lines are buffered meanwhile, see watch.EventBuffer.
             continue
         try:
             line=input()
         except KeyboardInterrupt:
             log.info("Exiting")
             break
-        line=line.strip()
-        keywords=line.split(" ")
-        command=keywords[0]
+        keywords=line.strip().split(" ")
+        handlers=LadderLogHandlers.dispatchTable.get(keywords[0])
+        if handlers is None:
+            continue # Nobody listens to this event.
         args=keywords[1:]
-        del keywords
-        #make command name CamelCase
-        real_commandname=command.upper()
-        command=command.lower()
-        command=command.replace("_"," ")
-        command=command.title()
-        command=command.replace(" ","")
-        #call handler
-        if(hasattr(LadderLogHandlers,command) ):
-                getattr(LadderLogHandlers,command)(*args)
-        if real_commandname in LadderLogHandlers.extraHandlers:
-            for extraHandler in LadderLogHandlers.extraHandlers[real_commandname]:
-                try: extraHandler(*args)
-                except TypeError as e: 
-                    log.error("Extension "+extraHandler.__package__+" registered a wrong ladderlog handler. This is a bug.")
-                    if debug: raise e
+        for handler in handlers:
+            try:
+                handler(*args)
+            except TypeError as e:
+                if getattr(handler, "__module__", None)==LadderLogHandlers.__name__:
+                    raise e
+                log.error("Extension "+str(getattr(handler, "__module__", handler))+" registered a wrong ladderlog handler. This is a bug.")
+                if debug: raise e
+        # Send all commands caused by this event at once.
+        sys.stdout.flush()
 if __name__=="__main__":
     main()
     exit(True)
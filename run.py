@@ -13,11 +13,15 @@ import time
 import traceback
 import yaml
 import atexit
+import stat
+import threading
 from threading import Thread, Event
 import parser
 import Global
 import extensions
 import Armagetronad
+import tools
+from watch import WatchFile, EventBuffer
 exitEvent=Event()
 __save_vars=["p"]
 
@@ -42,42 +46,75 @@ class FlushFile(io.TextIOWrapper):
         pass
     
 # CLASSES ###############################################
-class WatchFile():
-    def __init__(self, f):
-        self.f=f
-        self.last_read=""
-    def read(self, b=0):
-        while(True):
-            r=self.f.read()
-            if r!='':
-                return r
-            time.sleep(0.07)
-    def skipUnreadLines(self):
-        self.f.seek(0, io.SEEK_END)
-    def readline(self):
-        r=self.last_read
-        while(r.find("\n")==-1):
-            r=self.read()
-        self.last_read=r.split("\n",1)[1]
-        return r.split("\n")[0]
-
+## @brief Writes commands to the server.
+# @details Commands are queued and sent to the server with a single write when flush()
+#          is called, which parser.main does after every ladderlog event. Commands written
+#          from other threads are sent after max_latency seconds at the latest.
+#          If max_queued writes are waiting, further writes block until the queue was sent.
 class OutputToProcess(io.TextIOWrapper):
-    def __init__(self):
-        pass
+    def __init__(self, max_latency=0.005, max_queued=4096):
+        self.max_latency=max_latency
+        self.max_queued=max_queued
+        self.queue=[]
+        self.queued=threading.Condition()
+        self.send_lock=threading.Lock()
+        self.debuglog=None
+        if Global.debug:
+            self.debuglog=open("debug.log", "a")
+        t=Thread(None, self.flushForever, name="OutputFlusher")
+        t.daemon=True
+        t.start()
     def write(self, x):
-        try:
-            p.stdin.write(x.encode("latin-1"))
-            if Global.debug:
-                f=open("debug.log", "a+")
-                f.write(x)
-                f.close()
-            p.stdin.flush()
-        except IOError:
-            pass # Ignore
+        with self.queued:
+            while len(self.queue)>=self.max_queued:
+                self.queued.notify_all()
+                self.queued.wait()
+            self.queue.append(x)
+            if len(self.queue)==1 or len(self.queue)>=self.max_queued:
+                self.queued.notify_all()
+        return len(x)
+    ## @brief Sends all queued commands.
     def flush(self):
-        pass # File not buffered, ignore that.
+        with self.send_lock:
+            with self.queued:
+                if not self.queue:
+                    return
+                data="".join(self.queue)
+                self.queue=[]
+                self.queued.notify_all()
+            try:
+                p.stdin.write(data.encode("latin-1", "replace"))
+                p.stdin.flush()
+            except IOError:
+                pass # Ignore
+            if self.debuglog:
+                self.debuglog.write(data)
+                self.debuglog.flush()
+    ## @brief Sends commands that were queued for longer than max_latency.
+    # @details Runs in its own thread.
+    def flushForever(self):
+        while True:
+            with self.queued:
+                while not self.queue:
+                    self.queued.wait()
+                deadline=time.time()+self.max_latency
+                while len(self.queue)<self.max_queued:
+                    remaining=deadline-time.time()
+                    if remaining<=0:
+                        break
+                    self.queued.wait(remaining)
+            self.flush()
 
 # FUNCTIONS #############################################
+## @brief Opens the ladderlog.
+# @details Regular files are truncated. FIFOs are opened for reading and writing, so
+#          opening doesn't block until the server starts and there is always a writer.
+def openLadderlog(path):
+    if os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode):
+        return open(os.open(path, os.O_RDWR | os.O_NONBLOCK), "rb", buffering=0)
+    open(path, "w").close()
+    return open(path, encoding="latin-1")
+
 def exit():
     sys.stderr.write("Exiting ... ")
     parser.exit(True, True)
@@ -86,6 +123,7 @@ def exit():
     global p
     if p!=None:
         print("QUIT")
+        sys.stdout.flush()
         p.wait()
     atexit.unregister(exit)
     global exitEvent
@@ -132,6 +170,7 @@ def read_stdin():
                     exit()
             else:
                 Armagetronad.SendCommand(line)
+                sys.stdout.flush()
                 sys.stderr.write("Command sent to server.\n")
         except Exception as e:
             print(e)
@@ -148,6 +187,9 @@ def main():
     oparser.add_option("-p", "--prefix", dest="prefix", default=None, help="The prefix the server was installed to.")
     oparser.add_option("-n", "--name", dest="servername", default=None, help="The name of the server", metavar="SERVERNAME")
     oparser.add_option("--debug",dest="debug", default=False, action="store_true", help="Run in debug mode")
+    oparser.add_option("--output-latency", dest="output_latency", type="float", default=0.005, help="Maximal number of seconds commands are held back to send them together.", metavar="SECONDS")
+    oparser.add_option("--output-queue", dest="output_queue", type="int", default=4096, help="Maximal number of queued writes to the server before writing blocks.", metavar="SIZE")
+    oparser.add_option("--event-buffer", dest="event_buffer", type="int", default=100000, help="Maximal number of ladderlog events kept while the script is reloading or busy.", metavar="SIZE")
     oparser.add_option("--disable", dest="disabledCommands", action="append", help="Disable COMMAND.", metavar="COMMAND", default=[])
     oparser.add_option("--default", dest="save", action="store_true", default=False, help="Set this configuration as default")
     oparser.add_option("-D","--disableExt", dest="disabledExtensions", default=[], action="append", help="Dsiable the extension with the name EXTENSION.", metavar="EXTENSION")
@@ -227,7 +269,7 @@ def main():
         os.makedirs(userdatadir)
     if not os.path.exists(options.vardir):
         os.makedirs(options.vardir)
-    open(os.path.join(options.vardir,"ladderlog.txt"),"w" ).close()
+    ladderlog=openLadderlog(os.path.join(options.vardir,"ladderlog.txt") )
     print("[START] Starting server. Serverlog can be found in run/server.log")
     args=["--vardir",options.vardir, "--datadir",options.datadir, "--configdir",options.configdir,
           "--userdatadir",userdatadir, "--userconfigdir",userconfigdir]
@@ -238,11 +280,13 @@ def main():
     while(p==None):
         time.sleep(1) # Give the the server some time to start up
     atexit.register(exit)
-    sys.stdout=OutputToProcess()
     if os.path.exists("debug.log"):
         os.remove("debug.log")
-    sys.stdin=WatchFile(open(os.path.join(options.vardir,"ladderlog.txt"), encoding="latin-1" ) )
-    sys.stdin.skipUnreadLines()
+    sys.stdout=OutputToProcess(options.output_latency, options.output_queue)
+    ladderlog=WatchFile(ladderlog)
+    ladderlog.skipUnreadLines()
+    sys.stderr.write("[START] Waiting for ladderlog events using "+ladderlog.waiter.name+".\n")
+    sys.stdin=EventBuffer(ladderlog, options.event_buffer)
     sys.stderr=FlushFile(sys.__stdout__)
     t2=Thread(None, read_stdin)
     t2.daemon=True
@@ -250,6 +294,7 @@ def main():
     sys.stderr.write("Reading commands from stdin.\n")
     Global.server_name=options.servername
     extensions.loadExtensions()
+    tools.track_script_modules()
     sys.stderr.write("[START] Starting script.\n")
     sys.stderr.write("[START] Press ctrl+c or type /quit to exit.\n")
     sys.stderr.write("\n")
@@ -263,7 +308,6 @@ def main():
         except SystemExit:
             break
         except Global.ReloadException:
-            import tools
             tools.reload_script_modules()
             reloaded=True
             continue
@@ -276,7 +320,7 @@ def main():
             sys.stderr.flush()
             parser.exit(False, quiet=True)        
             try:
-                sys.stderr.write("Restarting in 3 seconds ... \n")        
+                sys.stderr.write("Restarting in 3 seconds. Ladderlog events are kept meanwhile ... \n")        
                 sys.stderr.write("\n")
                 time.sleep(3)
                 reloaded=True
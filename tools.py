@@ -1,12 +1,20 @@
 import os.path, sys
-import imp
+import importlib, importlib.util
 import inspect
+import hashlib
+import traceback
 
 sub_mods=dict()
 
+# Modification time and hash of the source of every script module, where the name of the
+# module is the key. Filled by track_script_modules().
+module_state=dict()
+
 def remove_duplicates(l):
-    ret=set()
-    map(ret.update, l)
+    ret=[]
+    for i in l:
+        if not any(i is j for j in ret):
+            ret.append(i)
     return ret
 
 def get_package(x):
@@ -43,7 +51,7 @@ def reload_none_modules():
     for mod in [i for i in sys.modules if sys.modules[i]==None]:
         sys.stderr.write("[Module None] "+mod+"\n")
         del(sys.modules[mod])
-        imp.load_module(mod, *imp.find_module(mod))
+        importlib.import_module(mod)
 
 def delete_module(mod):
     global sub_mods
@@ -97,7 +105,143 @@ def delete_modules_from_dir(directory=None, dir_rel=True):
             delete_module(mod)
     return need_delete, vars
 
+def get_source_state(mod):
+    if type(mod)==str:
+        mod=sys.modules[mod]
+    with open(mod.__file__, "rb") as f:
+        digest=hashlib.sha1(f.read()).hexdigest()
+    return os.path.getmtime(mod.__file__), digest
+
+def get_script_modules():
+    return [mod for mod in list(sys.modules) if mod!=__name__ and is_script_component(mod)]
+
+# Remembers the current source of the given modules, or of all script modules, so that
+# reload_script_modules() can tell which modules changed.
+def track_script_modules(modules=None):
+    if modules==None:
+        modules=get_script_modules()
+    for mod in modules:
+        try:
+            module_state[mod]=get_source_state(mod)
+        except (OSError, KeyError):
+            module_state.pop(mod, None)
+
+# Returns the names of the script modules whose source changed since they were tracked.
+# The hash is only computed if the modification time changed.
+def get_changed_modules():
+    changed=[]
+    for mod in get_script_modules():
+        try:
+            mtime=os.path.getmtime(sys.modules[mod].__file__)
+            if mod in module_state and module_state[mod][0]==mtime:
+                continue
+            state=get_source_state(mod)
+        except OSError:
+            continue
+        if mod not in module_state or module_state[mod][1]==state[1]:
+            module_state[mod]=state # New module or only touched
+            continue
+        changed.append(mod)
+    return changed
+
+# Returns the names of the script modules the given module imported functions or classes
+# from. References to modules aren't counted: reload_module executes the new code in the
+# existing module object, so they stay valid.
+def get_dependencies(mod):
+    deps=set()
+    for x in list(vars(sys.modules[mod]).values()):
+        if inspect.isfunction(x) or inspect.isclass(x):
+            dep=x.__module__
+        else:
+            continue
+        if dep!=mod and dep!=__name__ and dep in sys.modules and is_script_component(dep):
+            deps.add(dep)
+    return deps
+
+# Returns the given modules and all modules which depend on them, directly or indirectly,
+# sorted so that every module comes after the modules it depends on.
+def get_reload_order(modules):
+    deps=dict((mod, get_dependencies(mod)) for mod in get_script_modules())
+    dependents=dict()
+    for mod in deps:
+        for dep in deps[mod]:
+            dependents.setdefault(dep, set()).add(mod)
+    affected=set()
+    todo=list(modules)
+    while todo:
+        mod=todo.pop()
+        if mod in affected:
+            continue
+        affected.add(mod)
+        todo.extend(dependents.get(mod, ()))
+    order=[]
+    visited=set()
+    def visit(mod):
+        if mod in visited:
+            return
+        visited.add(mod)
+        for dep in sorted(deps.get(mod, ())):
+            if dep in affected:
+                visit(dep)
+        order.append(mod)
+    for mod in sorted(affected):
+        visit(mod)
+    return order
+
+# Executes the current source of a module in the existing module object, so all references
+# to the module stay valid. Variables listed in __save_vars are kept.
+# Ladderlog handlers the new code doesn't register again are removed afterwards. If executing
+# fails, the old handlers stay and __reload__ isn't called.
+def reload_module(mod):
+    module=sys.modules[mod]
+    saved=dict()
+    for var in getattr(module, "__save_vars", []):
+        if hasattr(module, var):
+            saved[var]=getattr(module, var)
+    handlers=None
+    if "LadderLogHandlers" in sys.modules and mod!="LadderLogHandlers":
+        handlers=sys.modules["LadderLogHandlers"].getModuleHandlers(mod)
+    sys.stderr.write("[Reload] "+mod+" ... ")
+    try:
+        spec=importlib.util.spec_from_file_location(mod, module.__file__, submodule_search_locations=getattr(module, "__path__", None))
+        module.__spec__=spec
+        module.__loader__=spec.loader
+        spec.loader.exec_module(module)
+    except Exception:
+        sys.stderr.write("Failed.\n")
+        traceback.print_exc(file=sys.stderr)
+        for var, value in saved.items():
+            setattr(module, var, value)
+        return False
+    sys.stderr.write("OK\n")
+    if handlers:
+        sys.modules["LadderLogHandlers"].unregister_handlers(handlers)
+    if hasattr(module, "__reload__"):
+        module.__reload__(**dict((var+"__old", value) for var, value in saved.items()))
+    else:
+        for var, value in saved.items():
+            setattr(module, var, value)
+    return True
+
+# Reloads the script modules whose source changed and all modules that depend on them.
+# If the sources weren't tracked yet, all script modules are reloaded.
 def reload_script_modules():
+    if not module_state:
+        return reload_all_script_modules()
+    import Global
+    Global.handleLadderLog=False
+    try:
+        changed=get_changed_modules()
+        if not changed:
+            sys.stderr.write("[Reload] No module changed.\n")
+            return
+        for mod in get_reload_order(changed):
+            if mod in sys.modules and reload_module(mod):
+                track_script_modules([mod])
+    finally:
+        Global.handleLadderLog=True
+
+def reload_all_script_modules():
     import Global
     Global.handleLadderLog=False
     main_mods=list()
@@ -113,7 +257,7 @@ def reload_script_modules():
                 continue
             try:
                 sys.stderr.write("[ReImport] "+mod+" ... ")
-                imp.load_module(mod, *imp.find_module(mod))
+                importlib.import_module(mod)
                 if mod in main_mods:
                     setattr(__main__, mod, sys.modules[mod])
             except ImportError:
@@ -139,4 +283,5 @@ def reload_script_modules():
                     setattr(sys.modules[mod], var, vars[mod][var])
     for mod in main_mods:
             setattr(__main__,mod, sys.modules[mod])
+    track_script_modules()
     Global.handleLadderLog=True
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+## @file watch.py
+# @brief Following growing files
+# @details This file contains classes to read lines from a file while another process
+#          is writing to it, like the ladderlog or the server log.
+
+import os
+import io
+import time
+import select
+import stat
+import ctypes
+import ctypes.util
+import threading
+from collections import deque
+
+## @brief Waits for new data by sleeping.
+# @details Fallback if neither inotify nor a pipe is available.
+class PollWaiter():
+    name="poll"
+    def __init__(self, interval=0.07):
+        self.interval=interval
+    def wait(self, timeout=None):
+        time.sleep(self.interval)
+    def close(self):
+        pass
+
+## @brief Waits until a pipe or FIFO becomes readable.
+class PipeWaiter():
+    name="pipe"
+    def __init__(self, fd):
+        self.fd=fd
+    def wait(self, timeout=None):
+        select.select([self.fd], [], [], timeout)
+    def close(self):
+        pass
+
+## @brief Waits for modifications of a file by using inotify.
+# @exception OSError Raised if inotify isn't available.
+class InotifyWaiter():
+    name="inotify"
+    IN_MODIFY=0x00000002
+    IN_CLOEXEC=0o2000000
+    def __init__(self, path):
+        libc_name=ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found.")
+        libc=ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify isn't supported.")
+        self.fd=libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd<0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.IN_MODIFY)<0:
+            errno=ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed for "+path)
+    def wait(self, timeout=None):
+        if select.select([self.fd], [], [], timeout)[0]:
+            os.read(self.fd, 4096) # Drain the pending events, we only need the wakeup.
+    def close(self):
+        os.close(self.fd)
+
+## @brief Get the best waiter for the given file.
+# @details Uses a PipeWaiter for pipes and FIFOs, an InotifyWaiter for regular files
+#          and falls back to polling if inotify isn't available.
+def getWaiter(f):
+    if stat.S_ISFIFO(os.fstat(f.fileno()).st_mode):
+        return PipeWaiter(f.fileno())
+    try:
+        return InotifyWaiter(f.name)
+    except (OSError, AttributeError, TypeError):
+        return PollWaiter()
+
+## @brief Splits a byte stream into lines.
+# @details Incomplete trailing data is kept in a bytearray. Every chunk is decoded only
+#          once and the complete lines are queued, so getting a line is O(1).
+class LineBuffer():
+    def __init__(self, encoding="latin-1"):
+        self.encoding=encoding
+        self.partial=bytearray()
+        self.lines=deque()
+    ## @brief Adds a chunk of data.
+    # @return The number of complete lines that are now available.
+    def feed(self, data):
+        end=data.rfind(b"\n")
+        if end==-1:
+            self.partial+=data
+            return len(self.lines)
+        if self.partial:
+            self.partial+=data[:end]
+            chunk=self.partial.decode(self.encoding)
+            self.partial=bytearray()
+        else:
+            chunk=data[:end].decode(self.encoding)
+        self.partial+=data[end+1:]
+        self.lines.extend(chunk.split("\n"))
+        return len(self.lines)
+    ## @brief Gets the next complete line without the line break.
+    # @exception IndexError Raised if no complete line is available.
+    def pop(self):
+        return self.lines.popleft()
+    def __len__(self):
+        return len(self.lines)
+
+class WatchFile():
+    ## @brief Maximal time to block in a waiter before checking the file again.
+    # @details Only a safety net in case a wakeup gets lost. Idle servers wake up this often.
+    wait_timeout=5
+    def __init__(self, f):
+        self.f=f
+        self.fd=f.fileno()
+        self.buffer=LineBuffer()
+        self.is_pipe=stat.S_ISFIFO(os.fstat(self.fd).st_mode)
+        if self.is_pipe:
+            os.set_blocking(self.fd, False)
+        self.waiter=getWaiter(f)
+    ## @brief Reads the next chunk of raw data.
+    # @details Blocks until data is available.
+    def read(self, b=65536):
+        while(True):
+            try:
+                r=os.read(self.fd, b or 65536)
+            except BlockingIOError:
+                r=b""
+            if r!=b"":
+                return r
+            self.waiter.wait(self.wait_timeout)
+    def skipUnreadLines(self):
+        if not self.is_pipe:
+            os.lseek(self.fd, 0, io.SEEK_END)
+    ## @brief Reads the next line.
+    # @details Blocks until a complete line is available.
+    # @return The line including the line break, like file.readline() does. This is
+    #         needed for input(), which raises EOFError for an empty string.
+    def readline(self):
+        while not len(self.buffer):
+            self.buffer.feed(self.read())
+        return self.buffer.pop()+"\n"
+
+## @brief Keeps reading lines while nobody handles them.
+# @details A thread reads the lines of the source and queues them together with the time
+#          they were read. So events that happen while the script reloads or restarts after
+#          a crash aren't lost and are handled in order afterwards.
+#          If max_lines lines are queued, reading pauses until lines were handled. The
+#          lines stay in the source meanwhile.
+class EventBuffer():
+    def __init__(self, source, max_lines=100000):
+        self.source=source
+        self.max_lines=max_lines
+        self.lines=deque()
+        self.cond=threading.Condition()
+        t=threading.Thread(None, self.readForever, name="EventBuffer")
+        t.daemon=True
+        t.start()
+    ## @brief Reads lines from the source and queues them.
+    # @details Runs in its own thread.
+    def readForever(self):
+        while True:
+            line=self.source.readline()
+            with self.cond:
+                while len(self.lines)>=self.max_lines:
+                    self.cond.wait()
+                self.lines.append((time.time(), line))
+                self.cond.notify_all()
+    ## @brief Gets the next line and the time it was read.
+    # @details Blocks until a line is available.
+    # @return Tuple of the time and the line.
+    def readEvent(self):
+        with self.cond:
+            while not self.lines:
+                self.cond.wait()
+            event=self.lines.popleft()
+            self.cond.notify_all()
+        return event
+    ## @brief Reads the next line.
+    # @details Blocks until a line is available. Used by input().
+    def readline(self):
+        return self.readEvent()[1]
+    ## @brief Gets the number of queued lines and how long the oldest one is waiting.
+    # @return Tuple of the number of lines and the age in seconds.
+    def pending(self):
+        with self.cond:
+            if not self.lines:
+                return 0, 0
+            return len(self.lines), time.time()-self.lines[0][0]
+    def __len__(self):
+        return len(self.lines)